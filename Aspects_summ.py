@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+from Templates import *
+
+# рабочий процесс разметки аспектов
+_worker = {}
+
+def init_worker(adj = False, mode = 'presence', time_budget = None):
+    """
+    Инициализация рабочего процесса: морфологический анализатор
+    и набор шаблонов загружаются один раз при запуске процесса.
+    """
+    resources.warmup()
+    # кэш морфологии сохраняется при завершении процесса, если задан MORPH_CACHE_PATH
+    morph_cache.persist_at_exit()
+    _worker['processor'] = TextProcessor(flag = adj, time_budget = time_budget)
+    _worker['mode'] = mode
+
+def tag_chunk(sentences):
+    processor, mode = _worker['processor'], _worker['mode']
+    return [tag_sentence(processor, sentence, mode) for sentence in sentences]
+
+# разметка одного предложения
+def tag_sentence(processor, sentence, mode = 'presence'):
+    """
+    Возвращает запись {"aspects": [аспект, ...]} для предложения.
+    В режимах 'best' и 'all' в записи есть и совпадения
+    {"matches": {аспект: [{шаблон: [строка, слов, длина шаблона]}, ...]}}
+    (см. Template.analyze()); в режиме 'best' по одному на аспект.
+    Если время на предложение исчерпано (см. TextProcessor),
+    в записи есть "timeout": true, а результат может быть неполным.
+    """
+    timeouts = processor.timeouts
+    _, parsed = next(processor.parse([sentence]))
+    result = processor.apply(parsed, mode)
+    record = {'aspects' : [aspect for aspect, found in zip(processor.aspects, result) if found]}
+    if mode != 'presence':
+        record['matches'] = {aspect : found for aspect, found in zip(processor.aspects, result) if found}
+    if processor.timeouts != timeouts:
+        record['timeout'] = True
+    return record
+
+# потоковая разметка
+def tag_stream(sentences, adj = False, mode = 'presence', workers = None, chunk_size = 256, time_budget = None):
+    """
+    Размечает аспекты для последовательности предложений и возвращает
+    генератор записей tag_sentence() в том же порядке. Предложения
+    читаются порциями по chunk_size по мере обработки: в пуле процессов
+    одновременно не больше двух порций на процесс, поэтому входной
+    файл может быть сколь угодно большим. Неизвестный mode вызывает
+    ValueError сразу, а не при первом обращении к генератору.
+    """
+    if mode not in TextProcessor.modes:
+        raise ValueError(f"Unknown mode: {mode}")
+    return _tag_stream(sentences, adj, mode, workers, chunk_size, time_budget)
+
+def _tag_stream(sentences, adj, mode, workers, chunk_size, time_budget):
+    sentences = iter(sentences)
+    chunks = iter(lambda: list(itertools.islice(sentences, chunk_size)), [])
+    if workers == 1:
+        init_worker(adj, mode, time_budget)
+        for chunk in chunks:
+            yield from tag_chunk(chunk)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(adj, mode, time_budget)) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(tag_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+# чтение предложений
+def read_sentences(file, field = None):
+    """
+    Возвращает пары (номер строки, предложение): одно предложение
+    на строку; если задан field, каждая строка - объект JSON,
+    и предложение берется из этого поля. Пустые строки пропускаются.
+    """
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if not line:
+            continue
+        yield number, json.loads(line)[field] if field is not None else line
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Tag sentences with aspects, one sentence per input line.")
+    parser.add_argument('input', nargs='?', default='-', help="input file (default: stdin)")
+    parser.add_argument('-o', '--output', help="JSON Lines output file (default: stdout)")
+    parser.add_argument('-m', '--mode', choices=list(TextProcessor.modes), default='presence',
+                        help="presence: aspect names only; best: top match per aspect; all: every match")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('-c', '--chunk-size', type=int, default=256, help="sentences per worker call")
+    parser.add_argument('--adj', action='store_true', help="use templates_2")
+    parser.add_argument('--field', default=None, help="read JSON Lines input and take the sentence from this field")
+    parser.add_argument('--time-budget', type=float, default=1.0,
+                        help="seconds per sentence for all templates (0 or less: no limit)")
+    parser.add_argument('--encoding', default=None, help="encoding of the input file")
+    args = parser.parse_args(argv)
+
+    input_file = open(args.input, 'r', encoding=args.encoding) if args.input != '-' else sys.stdin
+    output_file = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    stats = Counter()
+    started = time.perf_counter()
+    try:
+        numbered = read_sentences(input_file, args.field)
+        numbers = deque()
+
+        def sentences():
+            for number, sentence in numbered:
+                numbers.append(number)
+                yield sentence
+
+        for record in tag_stream(sentences(), args.adj, args.mode, args.workers, args.chunk_size,
+                                 args.time_budget if args.time_budget > 0 else None):
+            record = dict(line=numbers.popleft(), **record)
+            output_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            stats['sentences'] += 1
+            stats['timeouts'] += record.get('timeout', False)
+            stats.update(record['aspects'])
+    finally:
+        if args.input != '-':
+            input_file.close()
+        if args.output:
+            output_file.close()
+    seconds = time.perf_counter() - started
+    print(f"{stats['sentences']} sentences, {stats['sentences'] / seconds if seconds else 0.0:.1f} sentences/s, "
+          f"timeouts: {stats['timeouts']}, "
+          + ', '.join(f"{aspect}: {stats[aspect]}" for aspect in ASPECTS), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
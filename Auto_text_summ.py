@@ -1,14 +1,15 @@
 # -*- coding: utf-8 -*-
 
 import itertools
+from collections import namedtuple
 
 from Text_terms import *
 from Symmetrical_summ import *
 from Templates import *
+from Summ_metrics import NULL_METRICS
 
 # пересчет весов для предложений
 def countFinalWeights(tf_weights, stemmed_text, stemmed_pnn):
-    weighted_terms = dict(tf_weights.items())
     total_sents_in_text = stemmed_text.len
     
     # список первых и последних предложений
@@ -22,24 +23,9 @@ def countFinalWeights(tf_weights, stemmed_text, stemmed_pnn):
     stems_collection_of_first_last_sents = {
         pair[0] for pair in pairs_collection_of_first_last_sents }
     
-    # количество слов в первых и последних предложениях
-    total_stems_in_first_last = len(stems_collection_of_first_last_sents)
-    
-    # количество слов из словаря в первых и последних предложениях
-    total_dictwords_in_first_last = 0
-    for s1 in stems_collection_of_first_last_sents:
-        if s1 in tf_weights:
-            total_dictwords_in_first_last += 1
-    
     # количество слов в тексте
     total_stems_in_text = len(list(itertools.chain.from_iterable(stemmed_text.sentences())))
     
-    # среднее количество слов из словаря в первых и последних предложениях абзацев
-    avg_dictwords_in_first_last = total_dictwords_in_first_last / total_stems_in_first_last
-    
-    # среднее количество слов в первых и последних предложениях абзацев
-    avg_stems_in_first_last = total_stems_in_first_last / total_stems_in_text
-    
     # список вопросительных и восклиц. предложений
     collection_of_q_excl_sents = [
         sentence
@@ -52,6 +38,48 @@ def countFinalWeights(tf_weights, stemmed_text, stemmed_pnn):
     # количество вопросительных и восклицательных предложений в тексте
     num_of_q_excl_sents = len(collection_of_q_excl_sents)
     
+    return countTermWeights(
+        tf_weights,
+        stems_collection_of_first_last_sents,
+        stems_collection_of_q_excl_sents,
+        num_of_q_excl_sents,
+        total_sents_in_text,
+        total_stems_in_text,
+        stemmed_pnn)
+
+# пересчет весов терминов по статистике текста
+def countTermWeights(
+    tf_weights,
+    stems_collection_of_first_last_sents,
+    stems_collection_of_q_excl_sents,
+    num_of_q_excl_sents,
+    total_sents_in_text,
+    total_stems_in_text,
+    stemmed_pnn,
+):
+    """
+    Часть countFinalWeights(), которой нужна только сводная статистика
+    текста (множества стем первых/последних и вопросительных/восклицательных
+    предложений, их количество и общее количество предложений и стем),
+    а не сам текст. Используется и при потоковой обработке.
+    """
+    weighted_terms = dict(tf_weights.items())
+    
+    # количество слов в первых и последних предложениях
+    total_stems_in_first_last = len(stems_collection_of_first_last_sents)
+    
+    # количество слов из словаря в первых и последних предложениях
+    total_dictwords_in_first_last = 0
+    for s1 in stems_collection_of_first_last_sents:
+        if s1 in tf_weights:
+            total_dictwords_in_first_last += 1
+    
+    # среднее количество слов из словаря в первых и последних предложениях абзацев
+    avg_dictwords_in_first_last = total_dictwords_in_first_last / total_stems_in_first_last
+    
+    # среднее количество слов в первых и последних предложениях абзацев
+    avg_stems_in_first_last = total_stems_in_first_last / total_stems_in_text
+    
     """
     если термины есть в первых и последн. предложениях абзацев, то вес термина
     умножаем на частное среднего кол-ва терминов из словаря в первых и посл. предл.
@@ -83,42 +111,152 @@ def countFinalWeights(tf_weights, stemmed_text, stemmed_pnn):
             if weight > mean_weight}
     return sorted_tf
 
+# коэффициент индикаторов (аспектов) предложения
+def countIndicatorWeight(search_result):
+    """
+    По результатам TextProcessor.apply() для каждого найденного аспекта
+    к коэффициенту добавляется 1 или 0.5 в зависимости от длины шаблона
+    и количества совпавших слов в лучшем совпадении.
+    """
+    weight_indicator = 1
+    if search_result:
+        for lst in search_result:
+            if lst:
+                pattern_len = list(lst[0].values())[1][2]
+                word_num = list(lst[0].values())[1][1]
+                if pattern_len > 3:
+                    if word_num >= 3:
+                        weight_indicator += 1
+                    elif word_num == 2:
+                        weight_indicator += 0.5
+                elif pattern_len == 3:
+                    if word_num >= 2:
+                        weight_indicator += 1
+                    elif word_num == 1:
+                        weight_indicator += 0.5                                
+                else:
+                    if word_num >= pattern_len:
+                        weight_indicator += 1
+    return weight_indicator
+
+# коэффициенты индикаторов для части предложений
+def countIndicatorChunk(adj, parsed_sents, complete = False, time_budget = None):
+    """
+    Применяет шаблоны аспектов к разобранным предложениям (см.
+    TextProcessor.parse()) и возвращает для каждого пару
+    (коэффициент индикаторов, кортеж найденных аспектов).
+    Может выполняться в рабочем процессе пула: шаблоны берутся
+    из реестра этого процесса и компилируются в нем один раз.
+    Если complete, к паре добавляется признак того, что все шаблоны
+    проверены до конца (не превышено время time_budget, см. TextProcessor).
+    """
+    processor = TextProcessor(flag = adj, time_budget = time_budget)
+    result = []
+    for sentence in parsed_sents:
+        timeouts = processor.timeouts
+        search_result = processor.apply(sentence)
+        hits = tuple(aspect for aspect, lst in zip(processor.aspects, search_result) if lst)
+        if complete:
+            result.append((countIndicatorWeight(search_result), hits, processor.timeouts == timeouts))
+        else:
+            result.append((countIndicatorWeight(search_result), hits))
+    return result
+
+# коэффициенты индикаторов для предложений текста
+def countIndicatorWeights(adj, ordinary_sents, token_sents = None, pool = None, chunk_size = 64,
+                          cache = None, tokenizer = 'nltk', tagged_sents = None, time_budget = None,
+                          timed_out = None):
+    """
+    Возвращает для каждого предложения пару (коэффициент индикаторов,
+    кортеж найденных аспектов). Если переданы уже разобранные предложения
+    (token_sents) или готовые строки POS<лемма> (tagged_sents, см.
+    TextProcessor.tag()), повторная токенизация и морфологический анализ
+    не выполняются. Если передан пул (concurrent.futures.Executor),
+    шаблоны применяются порциями по chunk_size предложений параллельно.
+    Если передан кэш (Summ_cache.IndicatorCache), предложения, уже
+    встречавшиеся в этом или других текстах, берутся из него без разбора
+    и проверки шаблонами; результаты, не досчитанные из-за ограничения
+    времени (time_budget, см. TextProcessor), в кэш не записываются.
+    Если передано множество timed_out, в него добавляются номера
+    таких предложений.
+    """
+    missing = range(len(ordinary_sents))
+    if cache is not None:
+        keys = [cache.key(sentence, adj, tokenizer) for sentence in ordinary_sents]
+        result = cache.get_many(keys)
+        missing = [index for index, entry in enumerate(result) if entry is None]
+        if not missing:
+            return result
+        ordinary_sents = [ordinary_sents[index] for index in missing]
+        if token_sents is not None:
+            token_sents = [token_sents[index] for index in missing]
+        if tagged_sents is not None:
+            tagged_sents = [tagged_sents[index] for index in missing]
+    if tagged_sents is not None:
+        parsed_sents = list(tagged_sents)
+    else:
+        processor = TextProcessor(flag = adj)
+        parsed_sents = processor.parse(ordinary_sents) \
+            if token_sents is None \
+            else processor.parse_tokens(token_sents)
+        parsed_sents = [sentence for _, sentence in parsed_sents]
+    complete = cache is not None or timed_out is not None
+    if pool is None or len(parsed_sents) <= chunk_size:
+        indicator_weights = countIndicatorChunk(adj, parsed_sents, complete, time_budget)
+    else:
+        chunks = [parsed_sents[start:start + chunk_size]
+                  for start in range(0, len(parsed_sents), chunk_size)]
+        indicator_weights = list(itertools.chain.from_iterable(
+            pool.map(countIndicatorChunk, itertools.repeat(adj, len(chunks)), chunks,
+                     itertools.repeat(complete, len(chunks)), itertools.repeat(time_budget, len(chunks)))))
+    if not complete:
+        return indicator_weights
+    if timed_out is not None:
+        timed_out.update(index for index, (_, _, finished) in zip(missing, indicator_weights) if not finished)
+    if cache is None:
+        return [(weight_indicator, hits) for weight_indicator, hits, _ in indicator_weights]
+    for index, (weight_indicator, hits, _) in zip(missing, indicator_weights):
+        result[index] = (weight_indicator, hits)
+    cache.put_many([(keys[index], (weight_indicator, hits))
+                    for index, (weight_indicator, hits, finished) in zip(missing, indicator_weights) if finished])
+    return result
+
 # пересчет предложений по весам
-def convertFinalWeights(symmetry, symm_weights, ordinary_sents, indicators = True, adj = False):
+def convertFinalWeights(symmetry, symm_weights, ordinary_sents, indicators = True, adj = False, *,
+                        metrics = NULL_METRICS, aspect_hits = None, tagged_sents = None, tokenizer = 'nltk',
+                        pool = None, chunk_size = 64, indicator_cache = None, time_budget = None, timed_out = None):
     if indicators:
         """
-        Здесь стоит надстройка, что пересчитывает веса в зависимости от индикаторов
+        Здесь стоит надстройка, что пересчитывает веса в зависимости от индикаторов.
+        Если переданы строки POS<лемма> (tagged_sents, см. TextProcessor.tag()),
+        повторная токенизация и морфологический анализ не выполняются.
+        Все параметры после adj передаются только по имени.
+        Если передан словарь aspect_hits, в него записываются
+        аспекты, найденные в предложениях: {номер: (аспект, ...)}.
+        Если передан пул (concurrent.futures.Executor), шаблоны применяются
+        порциями по chunk_size предложений параллельно; результаты
+        собираются в исходном порядке и совпадают с последовательными.
+        Если передан indicator_cache (Summ_cache.IndicatorCache), повторяющиеся
+        предложения берутся из него (см. countIndicatorWeights()).
+        Если передано множество timed_out, в него добавляются номера
+        предложений, не досчитанных из-за ограничения времени time_budget.
         """
-        processor = TextProcessor(flag = adj)
+        indicator_weights = countIndicatorWeights(adj, ordinary_sents, None, pool, chunk_size,
+                                                  indicator_cache, tokenizer, tagged_sents, time_budget,
+                                                  timed_out)
         result = []
         for (counter, weight),\
             (index, original),\
-            ( _ , sentence)\
+            (weight_indicator, hits)\
         in \
             zip(symm_weights,
                 enumerate(ordinary_sents),
-                processor.parse(ordinary_sents)
+                indicator_weights
             ):
-            search_result = processor.apply(sentence)
-            weight_indicator = 1
-            if search_result:
-                for lst in search_result:
-                    if lst:
-                        pattern_len = list(lst[0].values())[1][2]
-                        word_num = list(lst[0].values())[1][1]
-                        if pattern_len > 3:
-                            if word_num >= 3:
-                                weight_indicator += 1
-                            elif word_num == 2:
-                                weight_indicator += 0.5
-                        elif pattern_len == 3:
-                            if word_num >= 2:
-                                weight_indicator += 1
-                            elif word_num == 1:
-                                weight_indicator += 0.5                                
-                        else:
-                            if word_num >= pattern_len:
-                                weight_indicator += 1
+            for aspect in hits:
+                metrics.count_aspect(aspect)
+            if hits and aspect_hits is not None:
+                aspect_hits[index] = hits
             if len(counter) > 6:
                 result.append((original, weight * weight_indicator, index))
         return sorted(result, key=lambda x: x[1], reverse=True)
@@ -139,15 +277,139 @@ def selectFinalSents(converted_sents, percentage=10):
     sorted_salient_sentences = sorted(converted_sents[:compression_rate], key=lambda w: w[2])
     return sorted_salient_sentences
 
+# выборка для нескольких степеней сжатия
+def selectFinalSentsMulti(converted_sents, percentages=(10, 20, 30)):
+    """
+    Метод возвращает выборки для нескольких процентов сжатия
+    по одному ранжированному списку. Список уже отсортирован
+    по убыванию веса, поэтому берется только его начало длиной
+    с наибольшую выборку, а каждая выборка - префикс этого начала.
+    Возвращается словарь {процент: выборка как в selectFinalSents()}.
+    """
+    counts = {percentage : int(len(converted_sents) * percentage / 100 + 0.5)
+              for percentage in percentages}
+    top = converted_sents[:max(counts.values(), default=0)]
+    return {percentage : sorted(top[:count], key=lambda w: w[2])
+            for percentage, count in counts.items()}
+
+# выборка по бюджету
+def selectByBudget(converted_sents, sentences=None, characters=None):
+    """
+    Метод выбирает предложения в порядке убывания веса, пока не исчерпан
+    бюджет: не больше sentences предложений и не больше characters символов
+    в сумме. Предложение, не помещающееся в оставшийся бюджет символов,
+    пропускается, и проверяется следующее. Результат, как и в
+    selectFinalSents(), упорядочен по позиции в оригинальном тексте.
+    """
+    selected = []
+    total_chars = 0
+    for sentence in converted_sents:
+        if sentences is not None and len(selected) >= sentences:
+            break
+        if characters is not None and total_chars + len(sentence[0]) > characters:
+            continue
+        selected.append(sentence)
+        total_chars += len(sentence[0])
+    return sorted(selected, key=lambda w: w[2])
+
+
+# результат реферирования
+class Summary(namedtuple('Summary', ['indices', 'weights', 'sentences', 'aspects'])):
+    """
+    Отобранные предложения в порядке следования в тексте: их номера,
+    итоговые веса, исходный текст и найденные в каждом предложении
+    аспекты (пустой кортеж, если аспектов нет или индикаторы не учитывались).
+    """
+    __slots__ = ()
+
+    @property
+    def text(self):
+        return '\n'.join(self.sentences)
+
+# текст не может быть реферирован
+class SummarizationError(Exception):
+    pass
+
+# в тексте меньше трех предложений
+class TextTooShortError(SummarizationError):
+    pass
+
+# в тексте нет ни одного термина
+class NoTermsError(SummarizationError):
+    pass
+
 
 # суммаризатор
 class SUMMARIZER():
 
-    def __init__(self):
+    def __init__(self, engine = 'python', metrics = None, cache = None, idf = None,
+                 template_pool = None, template_chunk_size = 64, window = None, window_unit = 'sentences',
+                 tokenizer = 'nltk', indicator_cache = None, time_budget = None):
+        """
+        engine - способ подсчета весов: 'python' (словари и Counter)
+        или 'numpy' (разреженные матрицы, см. Vector_summ).
+        metrics - объект Summ_metrics.Metrics для замеров этапов;
+        по умолчанию замеры отключены и почти ничего не стоят.
+        cache - объект Summ_cache.SummaryCache для повторно
+        присылаемых текстов; по умолчанию результаты не кэшируются.
+        idf - индекс Idf_index.IdfIndex, построенный по корпусу:
+        относительные частоты терминов умножаются на их idf.
+        template_pool - пул потоков или процессов (concurrent.futures.Executor),
+        в котором шаблоны аспектов применяются порциями по template_chunk_size
+        предложений (см. convertFinalWeights()); пулом управляет вызывающий.
+        window, window_unit - приближенный подсчет связей между предложениями
+        только в окне из window предложений или абзацев
+        (см. SymmetricalSummarizationWeightCount); только для engine = 'python'.
+        tokenizer - разбиение на предложения и словоформы: 'nltk'
+        (sent_tokenize, word_tokenize и check()) или 'regex' (один проход
+        регулярного выражения, см. Text_terms.RussianTokenizer).
+        indicator_cache - объект Summ_cache.IndicatorCache: коэффициенты
+        индикаторов повторяющихся предложений берутся из него без разбора
+        и проверки шаблонами; по умолчанию не кэшируются.
+        time_budget - время в секундах на проверку одного предложения
+        шаблонами (см. TextProcessor); по умолчанию не ограничено,
+        и результат не зависит от скорости машины. Число предложений,
+        не досчитанных из-за ограничения, накапливается в timeouts.
+        """
         self.language = 'ru'
-        self.stopwords = list(stopwords.words('russian'))
         self.re_term = re.compile("[\wа-яА-Я]+\-[\wа-яА-Я]+|[\wа-яА-Я]+|[!?]")
-        self.symmetry = SymmetricalSummarizationWeightCount()
+        self.symmetry = SymmetricalSummarizationWeightCount(window, window_unit)
+        if tokenizer not in ('nltk', 'regex'):
+            raise ValueError(f"Unknown tokenizer: {tokenizer}")
+        self.tokenizer = RussianTokenizer() if tokenizer == 'regex' else None
+        self.engine = engine
+        self.metrics = metrics or NULL_METRICS
+        self.cache = cache
+        self.idf = idf
+        self.template_pool = template_pool
+        self.template_chunk_size = template_chunk_size
+        self.indicator_cache = indicator_cache
+        self.time_budget = time_budget
+        self.timeouts = 0
+        if engine == 'numpy':
+            if window is not None:
+                raise ValueError("Window mode is supported by the python engine only")
+            from Vector_summ import VectorizedSummarizationWeightCount
+            self.vector = VectorizedSummarizationWeightCount()
+        elif engine != 'python':
+            raise ValueError(f"Unknown engine: {engine}")
+    
+    @property
+    def stopwords(self):
+        return resources.stopwords
+    
+    def warmup(self, indicators = True):
+        """
+        Заранее загружает морфологический анализатор, стеммер, токенизаторы,
+        стоп-слова и (если indicators) оба набора шаблонов, чтобы первый
+        документ не платил за загрузку. Нужен долгоживущим процессам;
+        без него ресурсы загружаются при первом обращении.
+        """
+        resources.warmup()
+        if indicators:
+            for flag in (False, True):
+                template_registry.get(template_set_name(flag))
+        return self
     
     def check(self, term):
         if term in self.stopwords:
@@ -157,76 +419,212 @@ class SUMMARIZER():
         else:
             return False
     
-    def summarize(self, file_name, output_name, indicators = True, adj = False, percentage = 10):
-        file = open(file_name, 'r')
-        text = StructuredText(text_segmentor(file.read()))
-        res = ''
+    def rank(self, raw_text, indicators = True, adj = False, aspect_hits = None):
+        """
+        Метод проводит полный цикл подсчета весов для текста, переданного
+        строкой, и возвращает отсортированный по убыванию веса список
+        предложений [(sentence, weight, index), ...] (см. convertFinalWeights()).
+        Если текст слишком короткий или в нем нет терминов,
+        выбрасывается исключение SummarizationError.
+        """
+        metrics = self.metrics
+        metrics.start_document()
+        try:
+            if self.cache is None:
+                ORIGINAL_SENTENCES = self.rankText(raw_text, indicators, adj, metrics, aspect_hits)
+            else:
+                ORIGINAL_SENTENCES = self.rankCached(raw_text, indicators, adj, metrics, aspect_hits)
+        except TextTooShortError:
+            metrics.end_document('short')
+            raise
+        except NoTermsError:
+            metrics.end_document('no_terms')
+            raise
+        except Exception:
+            metrics.end_document('error')
+            raise
+        metrics.end_document()
+        return ORIGINAL_SENTENCES
+    
+    def rankCached(self, raw_text, indicators, adj, metrics, aspect_hits = None):
+        window = (self.symmetry.window, self.symmetry.window_unit) if self.symmetry.window is not None else None
+        engine = self.engine if self.tokenizer is None else f"{self.engine}+regex"
+        key = self.cache.key(raw_text, indicators, adj, engine, self.idf, window)
+        entry = self.cache.get(key)
+        if entry is None:
+            hits = {}
+            timeouts = self.timeouts
+            ranked = self.rankText(raw_text, indicators, adj, metrics, hits)
+            if self.timeouts != timeouts:
+                # веса зависят от исчерпанного времени - не кэшируются
+                entry = (ranked, hits)
+            else:
+                entry = self.cache.put(key, ranked, hits)
+        else:
+            metrics.count('cache_hits')
+        ranked, hits = entry
+        if aspect_hits is not None:
+            aspect_hits.update(hits)
+        return list(ranked)
+    
+    def rankText(self, raw_text, indicators, adj, metrics, aspect_hits = None):
+        with metrics.stage('segment'):
+            if self.tokenizer is None:
+                text = StructuredText(text_segmentor(raw_text))
+            else:
+                # предложения и словоформы выделяются за один проход
+                segmented = self.tokenizer.segment(raw_text)
+                text = StructuredText([[sentence for sentence, _ in paragraph] for paragraph in segmented])
+        if metrics.enabled:
+            metrics.count('paragraphs', len(text.text))
+            metrics.count('sentences', text.len)
+        
+        if text.len < 3:
+            raise TextTooShortError("Text should be at least 3 sentences long.")
         
-        if text.len >= 3:
+        with metrics.stage('tokenize'):
+            # токенизация и морфологический анализ предложений (один проход для весов и шаблонов)
+            if self.tokenizer is None:
+                TOKENIZED_SENTENCES = (
+                    (analyze_sentence(sentence, self.check) for sentence in paragraph)
+                    for paragraph in text.text)
+            else:
+                TOKENIZED_SENTENCES = (
+                    (analyze_words(words, self.tokenizer.check) for _, words in paragraph)
+                    for paragraph in segmented)
             # стемминг предложений
             # текст без стоп-слов: (стема, слово), предложения сгруппированны по абзацам
-            STEMMED_SENTENCES = StructuredText(text.map_sent(
-                    lambda sentence:
-                    [(normalize(term), term)
-                         for term
-                         in word_tokenize(sentence)
-                         if self.check(term)] ))
-            # список всех стем
-            BIG_LIST_OF_PAIRS = list(itertools.chain.from_iterable(STEMMED_SENTENCES.sentences()))
-            LIST_OF_STEMS = [pair1[0] for pair1 in BIG_LIST_OF_PAIRS]
-
-            if LIST_OF_STEMS:
+            # (компактное представление: номера в словаре и массивы смещений);
+            # записи Token не хранятся - для шаблонов остаются только строки POS<лемма>
+            STEMMED_SENTENCES = CompactText()
+            TAGGED_SENTENCES = [] if indicators else None
+            total_tokens = 0
+            for paragraph in TOKENIZED_SENTENCES:
+                for tokens in paragraph:
+                    STEMMED_SENTENCES.add_sentence([(token.stem, token.word) for token in tokens if not token.stop])
+                    if indicators:
+                        TAGGED_SENTENCES.append(TextProcessor.tag(tokens))
+                    total_tokens += len(tokens)
+                STEMMED_SENTENCES.end_paragraph()
+            if self.tokenizer is not None:
+                del segmented
+        if metrics.enabled:
+            metrics.count('tokens', total_tokens)
+            metrics.count('terms', len(STEMMED_SENTENCES.stem_ids))
+            metrics.count('unique_stems', len(set(STEMMED_SENTENCES.stem_ids)))
+
+        if not STEMMED_SENTENCES.stem_ids:
+            raise NoTermsError("There are no words to process!")
+        
+        with metrics.stage('term_weights'):
+            # список "имён собственных"
+            STEMMED_PNN = lookForProper(STEMMED_SENTENCES.text)
+        
+            if self.engine == 'numpy':
+                # пересчет весов на разреженной матрице "предложение x термин"
+                SYMMETRICAL_WEIGHTS = self.vector.countSentenceWeights(
+                        STEMMED_SENTENCES, STEMMED_PNN, len(text.sentences()), self.idf)
+            else:
                 # список кортежей (слово, его относительная частота), усечённый по средней частоте
-                TOTAL_STEM_COUNT = dict(simpleTermFreqCount(LIST_OF_STEMS))
-                # список "имён собственных"
-                STEMMED_PNN = lookForProper(STEMMED_SENTENCES.text)
-                
+                TOTAL_STEM_COUNT = dict(simpleTermFreqCount(STEMMED_SENTENCES.stems()))
+                if self.idf is not None:
+                    TOTAL_STEM_COUNT = self.idf.weigh(TOTAL_STEM_COUNT)
+        
                 # список терминов с весовыми коэффициентами
                 SORTED_TFIDF = countFinalWeights(TOTAL_STEM_COUNT, STEMMED_SENTENCES, STEMMED_PNN)
                 SORTED_TFIDF = sorted(SORTED_TFIDF.items(), key=lambda w: w[1], reverse=True)
-                
-                # словари каждого предложения с частотностью по словам
-                S_with_termfreqs = [Counter([word[0] for word in sentence]) for sentence in STEMMED_SENTENCES.sentences()]
+        
+        if self.engine != 'numpy':
+            with metrics.stage('symmetry'):
+                # частоты стем каждого предложения (считаются по номерам стем при обращении)
+                S_with_termfreqs = STEMMED_SENTENCES.term_freqs()
                 # общее количество стем в тексте
-                TOTAL_STEMS_IN_TEXT = len(LIST_OF_STEMS)
+                TOTAL_STEMS_IN_TEXT = len(STEMMED_SENTENCES.stem_ids)
                 # общее количество предложений в тексте
                 TOTAL_SENTS_IN_TEXT = len(text.sentences())
-                
+        
                 # пересчет весов
                 SYMMETRICAL_WEIGHTS = self.symmetry.countFinalSymmetryWeight(
                         SORTED_TFIDF, S_with_termfreqs,
                         TOTAL_STEMS_IN_TEXT, TOTAL_SENTS_IN_TEXT,
-                        STEMMED_PNN)
-                
-                # отбор предложений
-                ORIGINAL_SENTENCES = convertFinalWeights(
-                        self.symmetry,
-                        SYMMETRICAL_WEIGHTS,
-                        text.sentences(),
-                        indicators, adj)
-                
-                #print(ORIGINAL_SENTENCES)
-                
-                res = selectFinalSents(ORIGINAL_SENTENCES, percentage)
-
-            else:
-                print("There are no words to process!")
-
-        else:
-            print("Text should be at least 3 sentences long.")
+                        STEMMED_PNN, [len(paragraph) for paragraph in STEMMED_SENTENCES.text])
+        
+        with metrics.stage('templates' if indicators else 'convert'):
+            # отбор предложений
+            timed_out = set() if indicators and self.time_budget is not None else None
+            ORIGINAL_SENTENCES = convertFinalWeights(
+                    self.symmetry,
+                    SYMMETRICAL_WEIGHTS,
+                    text.sentences(),
+                    indicators, adj,
+                    metrics = metrics,
+                    aspect_hits = aspect_hits,
+                    tagged_sents = TAGGED_SENTENCES,
+                    tokenizer = 'nltk' if self.tokenizer is None else 'regex',
+                    pool = self.template_pool,
+                    chunk_size = self.template_chunk_size,
+                    indicator_cache = self.indicator_cache,
+                    time_budget = self.time_budget,
+                    timed_out = timed_out)
+            if timed_out:
+                self.timeouts += len(timed_out)
+                metrics.count('timeouts', len(timed_out))
+        
+        #print(ORIGINAL_SENTENCES)
+        
+        return ORIGINAL_SENTENCES
+    
+    def summarize_rates(self, raw_text, percentages = (10, 20, 30), budgets = (), indicators = True, adj = False):
+        """
+        Метод строит рефераты нескольких объемов за один подсчет весов.
+        percentages - список процентов сжатия, budgets - список пар
+        (предложений, символов), где любой из пределов может быть None.
+        Возвращается словарь, где ключ - процент или пара бюджета,
+        значение - выборка [(sentence, weight, index), ...].
+        """
+        ranked = self.rank(raw_text, indicators, adj)
+        result = selectFinalSentsMulti(ranked, percentages)
+        for budget in budgets:
+            result[tuple(budget)] = selectByBudget(ranked, *budget)
+        return result
+    
+    def summarize_text(self, raw_text, indicators = True, adj = False, percentage = 10):
+        """
+        Реферирует текст, переданный строкой, без файлового ввода-вывода
+        и печати. Возвращает Summary с предложениями, отобранными
+        как в selectFinalSents(). Если текст слишком короткий или в нем
+        нет терминов, выбрасывается исключение SummarizationError.
+        """
+        aspect_hits = {} if indicators else None
+        selected = selectFinalSents(self.rank(raw_text, indicators, adj, aspect_hits), percentage)
+        return Summary(
+            tuple(index for _, _, index in selected),
+            tuple(weight for _, weight, _ in selected),
+            tuple(sentence for sentence, _, _ in selected),
+            tuple(aspect_hits.get(index, ()) if indicators else () for _, _, index in selected))
+    
+    def summarize(self, file_name, output_name, indicators = True, adj = False, percentage = 10,
+                  encoding = None, echo = True):
+        """
+        Реферирует файл file_name и записывает отобранные предложения
+        в output_name по одному в строке (см. summarize_text()).
+        Если echo, предложения также печатаются.
+        """
+        with open(file_name, 'r', encoding=encoding) as file:
+            raw_text = file.read()
+        
+        try:
+            summary = self.summarize_text(raw_text, indicators, adj, percentage)
+        except SummarizationError as error:
+            print(error)
+            summary = Summary((), (), (), ())
             
         # результат записан в отдельный файл
-        with open(output_name, 'w') as output_file:
-            for sent3 in range(len(res)):
-                #output_file.write(str(res[sent3][2]) + ',') # для выдачи № выбранных предложений
-                output_file.write(res[sent3][0] + '\n')
-                print(res[sent3][0])
-            '''
-            output_file.write(str(len(text.sentences()))) # для выдачи № выбранных предложений
-            
-            print(len(res)) # для подсчета длины реферата
-            for i, x in enumerate(text.sentences()): # для получения разбиения на предложения
-                output_file.write(str(i+1) + '. ' + x + '\n')'''
+        with open(output_name, 'w', encoding=encoding) as output_file:
+            for sentence in summary.sentences:
+                output_file.write(sentence + '\n')
+                if echo:
+                    print(sentence)
 
                 
 if __name__ == '__main__':
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from Auto_text_summ import *
+from Summ_cache import SummaryCache, IndicatorCache
+from Idf_index import IdfIndex
+
+# суммаризатор рабочего процесса (создается один раз при запуске процесса)
+_worker = {}
+
+def init_worker(indicators = True, adj = False, percentage = 10, encoding = None, cache_path = None,
+                idf_path = None, indicator_cache_path = None, time_budget = None):
+    """
+    Инициализация рабочего процесса: стоп-слова, морфологический
+    анализатор и скомпилированные шаблоны загружаются один раз
+    и используются для всех документов, попавших в процесс.
+    Если задан cache_path, повторяющиеся документы берутся из общего
+    кэша результатов (см. Summ_cache). Если задан idf_path, веса терминов
+    умножаются на idf из индекса корпуса (см. Idf_index). Если задан
+    indicator_cache_path, результаты шаблонов для повторяющихся предложений
+    берутся из общего кэша (см. Summ_cache.IndicatorCache). time_budget -
+    время на проверку предложения шаблонами (см. TextProcessor).
+    """
+    cache = SummaryCache(path=cache_path) if cache_path else None
+    idf = IdfIndex(idf_path) if idf_path else None
+    indicator_cache = IndicatorCache(path=indicator_cache_path) if indicator_cache_path else None
+    _worker['summarizer'] = SUMMARIZER(cache=cache, idf=idf, indicator_cache=indicator_cache,
+                                       time_budget=time_budget)
+    _worker['params'] = (indicators, adj, percentage)
+    _worker['encoding'] = encoding
+    resources.warmup()
+    # кэш морфологии сохраняется при завершении процесса, если задан MORPH_CACHE_PATH
+    morph_cache.persist_at_exit()
+    if indicators:
+        template_registry.get(template_set_name(adj))
+
+def summarize_document(file_name):
+    """
+    Реферирует один документ в рабочем процессе. Ошибки не прерывают
+    обработку корпуса, а записываются в результат со статусом
+    (см. summarize_record()).
+    """
+    indicators, adj, percentage = _worker['params']
+    record = {'file' : file_name}
+    try:
+        with open(file_name, 'r', encoding=_worker['encoding']) as file:
+            raw_text = file.read()
+    except Exception as error:
+        record.update(status='error', indices=[], summary=[], error=f"{type(error).__name__}: {error}")
+        return record
+    record.update(summarize_record(_worker['summarizer'], raw_text, indicators, adj, percentage))
+    return record
+
+def summarize_files(file_names):
+    return [summarize_document(file_name) for file_name in file_names]
+
+def crashed_records(file_names, error):
+    return [{'file' : file_name, 'status' : 'error', 'indices' : [], 'summary' : [],
+             'error' : f"{type(error).__name__}: {error}"} for file_name in file_names]
+
+def summarize_record(summarizer, raw_text, indicators = True, adj = False, percentage = 10):
+    """
+    Реферирует текст и возвращает запись со статусом:
+    ok - реферат построен, short - меньше трех предложений,
+    no_terms - нет терминов, error - любая другая ошибка.
+    """
+    record = {'status' : 'ok', 'indices' : [], 'summary' : []}
+    try:
+        summary = summarizer.summarize_text(raw_text, indicators, adj, percentage)
+        record['indices'] = list(summary.indices)
+        record['summary'] = list(summary.sentences)
+        record['weights'] = list(summary.weights)
+        record['aspects'] = [list(aspects) for aspects in summary.aspects]
+    except TextTooShortError as error:
+        record['status'] = 'short'
+        record['error'] = str(error)
+    except NoTermsError as error:
+        record['status'] = 'no_terms'
+        record['error'] = str(error)
+    except Exception as error:
+        record['status'] = 'error'
+        record['error'] = f"{type(error).__name__}: {error}"
+    return record
+
+# список файлов корпуса
+def collect_inputs(sources):
+    """
+    Каждый источник - это каталог (берутся все файлы в нем),
+    маска glob или путь к файлу. Возвращается список файлов без повторов
+    в порядке перечисления источников.
+    """
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            files.extend(sorted(
+                os.path.join(source, name) for name in os.listdir(source)
+                if os.path.isfile(os.path.join(source, name))))
+        elif any(char in source for char in '*?['):
+            files.extend(sorted(path for path in glob.glob(source) if os.path.isfile(path)))
+        else:
+            files.append(source)
+    return list(dict.fromkeys(files))
+
+# реферирование пулом процессов с восстановлением после падения процесса
+def summarize_pool(files, workers, batch_size, initargs):
+    """
+    Генератор записей summarize_document() в порядке files. Документы
+    отправляются в пул порциями по batch_size, одновременно в работе
+    не больше двух порций на процесс. Если рабочий процесс завершился
+    аварийно (BrokenProcessPool - падение или нехватка памяти в pymorphy2
+    или regex), пул создается заново и документы порции, на которой это
+    обнаружено, повторяются по одному; документ, на котором процесс падает
+    и при повторе, записывается со статусом error. Незавершенные порции
+    отправляются в новый пул, готовые результаты сохраняются.
+    """
+    def create():
+        return ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs)
+
+    def restart(executor):
+        executor.shutdown()
+        return create()
+
+    batches = deque(files[start:start + batch_size] for start in range(0, len(files), batch_size))
+    pending = deque()
+    executor = create()
+    try:
+        while batches or pending:
+            while batches and len(pending) < 2 * workers:
+                batch = batches.popleft()
+                pending.append((batch, executor.submit(summarize_files, batch)))
+            batch, future = pending.popleft()
+            try:
+                records = future.result()
+            except BrokenProcessPool:
+                executor = restart(executor)
+                records = []
+                for file_name in batch:
+                    try:
+                        records.extend(executor.submit(summarize_files, [file_name]).result())
+                    except BrokenProcessPool as error:
+                        executor = restart(executor)
+                        records.extend(crashed_records([file_name], error))
+                pending = deque(
+                    (other, done if done.done() and not done.cancelled() and done.exception() is None
+                     else executor.submit(summarize_files, other))
+                    for other, done in pending)
+            yield from records
+    finally:
+        executor.shutdown()
+
+# пакетное реферирование корпуса
+def summarize_corpus(sources, output_name, workers = None, chunk_size = 64,
+                     indicators = True, adj = False, percentage = 10,
+                     encoding = None, report = None, cache_path = None, idf_path = None,
+                     indicator_cache_path = None, time_budget = None):
+    """
+    Реферирует все документы корпуса пулом процессов (см. summarize_pool()). Результаты пишутся
+    в файл output_name в формате JSON Lines (одна запись на документ,
+    в порядке входного списка) порциями по chunk_size записей.
+    После каждой порции вызывается report(stats), если он задан.
+    Возвращается словарь со статистикой: количество документов
+    по статусам, затраченное время и пропускная способность.
+    """
+    files = collect_inputs(sources)
+    stats = {'documents' : 0, 'ok' : 0, 'short' : 0, 'no_terms' : 0, 'error' : 0}
+    started = time.perf_counter()
+    initargs = (indicators, adj, percentage, encoding, cache_path, idf_path, indicator_cache_path, time_budget)
+
+    def update(records):
+        output_file.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        output_file.flush()
+        for record in records:
+            stats['documents'] += 1
+            stats[record['status']] += 1
+        stats['seconds'] = time.perf_counter() - started
+        stats['docs_per_sec'] = stats['documents'] / stats['seconds'] if stats['seconds'] else 0.0
+        if report is not None:
+            report(stats)
+
+    with open(output_name, 'w', encoding='utf-8') as output_file:
+        if workers == 1:
+            init_worker(*initargs)
+            results = map(summarize_document, files)
+        else:
+            workers = workers or os.cpu_count() or 1
+            results = summarize_pool(files, workers, max(1, chunk_size // (workers * 4)), initargs)
+        chunk = []
+        for record in results:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                update(chunk)
+                chunk = []
+        if chunk or not stats['documents']:
+            update(chunk)
+    return stats
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Batch summarization of a text corpus.")
+    parser.add_argument('inputs', nargs='+', help="directories, glob masks or files")
+    parser.add_argument('-o', '--output', required=True, help="JSON Lines output file")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('-c', '--chunk-size', type=int, default=64, help="records per output write")
+    parser.add_argument('-p', '--percentage', type=float, default=10)
+    parser.add_argument('--adj', action='store_true', help="use templates_2")
+    parser.add_argument('--no-indicators', action='store_true', help="skip aspect templates")
+    parser.add_argument('--encoding', default=None, help="encoding of input files")
+    parser.add_argument('--cache', default=None, help="SQLite file for the result cache")
+    parser.add_argument('--idf', default=None, help="corpus IDF index built by Idf_index.py")
+    parser.add_argument('--indicator-cache', default=None, help="SQLite file for per-sentence template results")
+    parser.add_argument('--time-budget', type=float, default=1.0,
+                        help="seconds per sentence for all templates (0 or less: no limit)")
+    args = parser.parse_args(argv)
+
+    def report(stats):
+        print(f"{stats['documents']} documents, {stats['docs_per_sec']:.1f} docs/s "
+              f"(ok: {stats['ok']}, short: {stats['short']}, "
+              f"no terms: {stats['no_terms']}, errors: {stats['error']})", file=sys.stderr)
+
+    summarize_corpus(args.inputs, args.output, args.workers, args.chunk_size,
+                     not args.no_indicators, args.adj, args.percentage,
+                     args.encoding, report, args.cache, args.idf, args.indicator_cache,
+                     args.time_budget if args.time_budget > 0 else None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from Auto_text_summ import *
+
+# синтетический корпус заданного размера
+def build_corpus(seed_text, sentences, seed = 0):
+    """
+    Строит русскоязычный текст примерно из sentences предложений
+    на основе исходного текста: каждое предложение - случайное предложение
+    исходного текста, в котором около трети слов заменены случайными
+    словами из его же словаря. Абзацы содержат от 2 до 6 предложений.
+    """
+    rng = random.Random(seed)
+    seed_sents = [sentence.split() for sentence in itertools.chain.from_iterable(text_segmentor(seed_text))
+                  if len(sentence.split()) > 2]
+    vocabulary = [word.strip('.,:;!?()«»"') for sentence in seed_sents for word in sentence]
+    vocabulary = [word.lower() for word in vocabulary if word]
+
+    paragraphs = []
+    total = 0
+    while total < sentences:
+        paragraph = []
+        for _ in range(min(rng.randint(2, 6), sentences - total)):
+            words = list(rng.choice(seed_sents))
+            for position in range(1, len(words) - 1):
+                if rng.random() < 0.33:
+                    words[position] = rng.choice(vocabulary)
+            paragraph.append(' '.join(words))
+            total += 1
+        paragraphs.append(' '.join(paragraph))
+    return '\n'.join(paragraphs)
+
+# этапы конвейера SUMMARIZER.rank(); каждый берет входные данные из state и дописывает результат
+def stage_segment(summarizer, state):
+    state['text'] = StructuredText(text_segmentor(state['raw']))
+
+def stage_tokenize(summarizer, state):
+    state['tokens'] = StructuredText(state['text'].map_sent(
+        lambda sentence: analyze_sentence(sentence, summarizer.check)))
+    state['stemmed'] = CompactText.from_paragraphs(state['tokens'].map_sent(
+        lambda tokens: [(token.stem, token.word) for token in tokens if not token.stop]))
+
+def stage_term_weights(summarizer, state):
+    stemmed = state['stemmed']
+    state['pnn'] = lookForProper(stemmed.text)
+    tf_weights = dict(simpleTermFreqCount(stemmed.stems()))
+    tfidf = countFinalWeights(tf_weights, stemmed, state['pnn'])
+    state['tfidf'] = sorted(tfidf.items(), key=lambda w: w[1], reverse=True)
+
+def stage_symmetry(summarizer, state):
+    state['symmetry'] = count_symmetry(summarizer.symmetry, state)
+
+def count_symmetry(symmetry, state):
+    stemmed = state['stemmed']
+    # частоты стем предложений - как в SUMMARIZER.rankText()
+    sents_with_termfreqs = stemmed.term_freqs()
+    return symmetry.countFinalSymmetryWeight(
+        state['tfidf'], sents_with_termfreqs,
+        len(stemmed.stem_ids), state['text'].len, state['pnn'],
+        [len(paragraph) for paragraph in stemmed.text])
+
+def stage_template_parse(summarizer, state):
+    processor = TextProcessor(flag = state['adj'])
+    state['parsed'] = [parsed for _, parsed in processor.parse(state['text'].sentences())]
+
+def stage_template_apply(summarizer, state):
+    processor = TextProcessor(flag = state['adj'])
+    state['indicators'] = [countIndicatorWeight(processor.apply(parsed)) for parsed in state['parsed']]
+
+def stage_select(summarizer, state):
+    converted = convertFinalWeights(summarizer.symmetry, state['symmetry'], state['text'].sentences(), False)
+    state['summary'] = selectFinalSents(converted, state['percentage'])
+
+def stage_rank(summarizer, state):
+    selectFinalSents(summarizer.rank(state['raw'], True, state['adj']), state['percentage'])
+
+STAGES = [
+    ('text_segmentor', stage_segment),
+    ('tokenize_normalize', stage_tokenize),
+    ('term_weights', stage_term_weights),
+    ('symmetry', stage_symmetry),
+    ('template_parse', stage_template_parse),
+    ('template_apply', stage_template_apply),
+    ('select', stage_select),
+    ('full_rank', stage_rank),
+]
+
+def run_stage(stage, summarizer, state, repeat, warm_cache):
+    """
+    Время этапа - лучшее из repeat запусков (стенное и процессорное),
+    пиковая память - отдельным запуском под tracemalloc, чтобы
+    трассировка не искажала время. Если warm_cache ложно, кэш морфологии
+    очищается перед каждым запуском.
+    """
+    best_wall = best_cpu = float('inf')
+    for _ in range(repeat):
+        if not warm_cache:
+            morph_cache.clear()
+        wall, cpu = time.perf_counter(), time.process_time()
+        stage(summarizer, state)
+        best_wall = min(best_wall, time.perf_counter() - wall)
+        best_cpu = min(best_cpu, time.process_time() - cpu)
+
+    if not warm_cache:
+        morph_cache.clear()
+    tracemalloc.start()
+    stage(summarizer, state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best_wall, best_cpu, peak
+
+def run_benchmark(seed_text, sizes, repeat = 3, adj = False, percentage = 10, warm_cache = False, report = None):
+    summarizer = SUMMARIZER()
+    # шаблоны компилируются один раз на процесс и не входят в замеры
+    template_registry.get(template_set_name(adj))
+    results = []
+    for size in sizes:
+        state = {'raw' : build_corpus(seed_text, size), 'adj' : adj, 'percentage' : percentage}
+        for name, stage in STAGES:
+            wall, cpu, peak = run_stage(stage, summarizer, state, repeat, warm_cache)
+            sentences = state['text'].len
+            result = {
+                'size' : size,
+                'stage' : name,
+                'sentences' : sentences,
+                'wall_seconds' : wall,
+                'cpu_seconds' : cpu,
+                'sentences_per_sec' : sentences / wall if wall else None,
+                'peak_kb' : peak / 1024,
+            }
+            results.append(result)
+            if report is not None:
+                report(result)
+    return results
+
+# сравнение приближенного подсчета связей (окно) с точным
+def window_report(seed_text, sizes, windows, window_unit = 'sentences', repeat = 3, percentage = 10,
+                  report = None):
+    """
+    Для исходного текста и синтетических корпусов из sizes предложений
+    считает веса предложений точно и с каждым окном из windows
+    (см. SymmetricalSummarizationWeightCount) и сравнивает ранжирование
+    без учета шаблонов: время подсчета симметричных весов (лучшее
+    из repeat), долю предложений точного реферата (percentage),
+    попавших в реферат с окном, и коэффициент ранговой корреляции
+    Спирмена между ранжированными списками.
+    """
+    summarizer = SUMMARIZER()
+    results = []
+    for size, raw in [('seed', seed_text)] + [(size, build_corpus(seed_text, size)) for size in sizes]:
+        state = {'raw' : raw}
+        for stage in (stage_segment, stage_tokenize, stage_term_weights):
+            stage(summarizer, state)
+        exact_seconds, exact = rank_symmetry(SymmetricalSummarizationWeightCount(), state, repeat)
+        exact_summary = {index for _, _, index in selectFinalSents(exact, percentage)}
+        exact_ranks = {index : rank for rank, (_, _, index) in enumerate(exact)}
+        for window in windows:
+            seconds, ranked = rank_symmetry(SymmetricalSummarizationWeightCount(window, window_unit), state, repeat)
+            summary = {index for _, _, index in selectFinalSents(ranked, percentage)}
+            # ранжируются одни и те же предложения, поэтому ранги без повторов
+            n = len(ranked)
+            squares = sum((rank - exact_ranks[index]) ** 2 for rank, (_, _, index) in enumerate(ranked))
+            result = {
+                'size' : size,
+                'sentences' : state['text'].len,
+                'window' : window,
+                'window_unit' : window_unit,
+                'exact_seconds' : exact_seconds,
+                'window_seconds' : seconds,
+                'summary_overlap' : len(summary & exact_summary) / len(exact_summary) if exact_summary else 1.0,
+                'spearman' : 1 - 6 * squares / (n * (n * n - 1)) if n > 1 else 1.0,
+            }
+            results.append(result)
+            if report is not None:
+                report(result)
+    return results
+
+def rank_symmetry(symmetry, state, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        weights = count_symmetry(symmetry, state)
+        best = min(best, time.perf_counter() - started)
+    return best, convertFinalWeights(symmetry, weights, state['text'].sentences(), False)
+
+# сравнение токенизатора RussianTokenizer с NLTK
+def tokenizer_report(seed_text, sizes, repeat = 3, report = None):
+    """
+    Для исходного текста и синтетических корпусов из sizes предложений
+    сравнивает разбиение на предложения и выделение терминов связкой
+    text_segmentor() + word_tokenize() + SUMMARIZER.check() и одним
+    проходом RussianTokenizer: время (лучшее из repeat, без морфологического
+    анализа), долю совпавших предложений и предложений с совпавшими
+    списками терминов, а также совпадение ранжирования SUMMARIZER.rank().
+    """
+    summarizer = SUMMARIZER()
+    fused = SUMMARIZER(tokenizer = 'regex')
+    tokenizer = fused.tokenizer
+    # загрузка моделей и словарей не входит в замеры
+    resources.warmup()
+
+    def nltk_terms(raw):
+        return [(sentence, tuple(word for word in resources.word_tokenize(sentence) if summarizer.check(word)))
+                for paragraph in text_segmentor(raw) for sentence in paragraph]
+
+    def regex_terms(raw):
+        return [(sentence, tuple(word for word in words if tokenizer.check(word)))
+                for paragraph in tokenizer.segment(raw) for sentence, words in paragraph]
+
+    results = []
+    for size, raw in [('seed', seed_text)] + [(size, build_corpus(seed_text, size)) for size in sizes]:
+        timings = {}
+        for name, function in (('nltk', nltk_terms), ('regex', regex_terms)):
+            best = float('inf')
+            for _ in range(repeat):
+                started = time.perf_counter()
+                terms = function(raw)
+                best = min(best, time.perf_counter() - started)
+            timings[name] = best, terms
+        (nltk_seconds, expected), (regex_seconds, found) = timings['nltk'], timings['regex']
+        sentences = Counter(sentence for sentence, _ in expected) & Counter(sentence for sentence, _ in found)
+        matched = Counter(expected) & Counter(found)
+        result = {
+            'size' : size,
+            'sentences' : len(expected),
+            'nltk_seconds' : nltk_seconds,
+            'regex_seconds' : regex_seconds,
+            'speedup' : nltk_seconds / regex_seconds if regex_seconds else None,
+            'same_sentences' : sum(sentences.values()) / len(expected) if expected else 1.0,
+            'same_terms' : sum(matched.values()) / len(expected) if expected else 1.0,
+            'same_ranking' : summarizer.rank(raw) == fused.rank(raw),
+        }
+        results.append(result)
+        if report is not None:
+            report(result)
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# сравнение с сохраненными результатами
+def compare(results, baseline, threshold = 0.2):
+    """
+    Возвращает список регрессий: этапы, у которых при том же размере
+    корпуса стенное время выросло больше чем на threshold (доля).
+    """
+    previous = {(item['size'], item['stage']) : item for item in baseline['results']}
+    regressions = []
+    for item in results:
+        old = previous.get((item['size'], item['stage']))
+        if old and old['wall_seconds'] and item['wall_seconds'] > old['wall_seconds'] * (1 + threshold):
+            regressions.append((item['size'], item['stage'], old['wall_seconds'], item['wall_seconds']))
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Benchmark the SUMMARIZER pipeline stages.")
+    parser.add_argument('--seed', default='text.txt', help="seed text for synthetic corpora")
+    parser.add_argument('--encoding', default='cp1251', help="encoding of the seed text")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[30, 300, 3000, 30000],
+                        help="corpus sizes in sentences")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--adj', action='store_true', help="use templates_2")
+    parser.add_argument('--warm-cache', action='store_true', help="keep the morphology cache between runs")
+    parser.add_argument('-o', '--output', help="save results as JSON")
+    parser.add_argument('--compare', help="JSON results of a previous run")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed slowdown before a regression")
+    parser.add_argument('--windows', type=int, nargs='+',
+                        help="compare windowed symmetric linking with the exact mode instead of timing stages")
+    parser.add_argument('--tokenizer-report', action='store_true',
+                        help="compare the regex tokenizer with NLTK instead of timing stages")
+    parser.add_argument('--window-unit', choices=SymmetricalSummarizationWeightCount.window_units,
+                        default='sentences')
+    args = parser.parse_args(argv)
+
+    with open(args.seed, 'r', encoding=args.encoding) as file:
+        seed_text = file.read()
+
+    if args.tokenizer_report:
+        def report_tokenizer(item):
+            print(f"{item['size']:>7} {item['sentences']:>7} sent  nltk {item['nltk_seconds']:>8.4f}s "
+                  f"regex {item['regex_seconds']:>8.4f}s x{item['speedup'] or 0:>5.1f}  "
+                  f"sentences {item['same_sentences']:>6.1%} terms {item['same_terms']:>6.1%} "
+                  f"ranking {'same' if item['same_ranking'] else 'differs'}", file=sys.stderr)
+
+        results = tokenizer_report(seed_text, args.sizes, args.repeat, report=report_tokenizer)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump({'meta' : {'revision' : git_revision(), 'repeat' : args.repeat},
+                           'results' : results}, file, ensure_ascii=False, indent=2)
+        return
+
+    if args.windows:
+        def report_window(item):
+            print(f"{item['size']:>7} {item['sentences']:>7} sent  window {item['window']:>4} {item['window_unit']:<10} "
+                  f"exact {item['exact_seconds']:>8.4f}s window {item['window_seconds']:>8.4f}s "
+                  f"overlap {item['summary_overlap']:>5.2f} spearman {item['spearman']:>6.3f}", file=sys.stderr)
+
+        results = window_report(seed_text, args.sizes, args.windows, args.window_unit, args.repeat,
+                                report=report_window)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump({'meta' : {'revision' : git_revision(), 'repeat' : args.repeat},
+                           'results' : results}, file, ensure_ascii=False, indent=2)
+        return
+
+    def report(item):
+        print(f"{item['size']:>7} {item['stage']:<20} {item['wall_seconds']:>9.4f}s "
+              f"{item['sentences_per_sec'] or 0:>10.0f} sent/s {item['peak_kb']:>10.0f} KB", file=sys.stderr)
+
+    results = run_benchmark(seed_text, args.sizes, args.repeat, args.adj,
+                            warm_cache=args.warm_cache, report=report)
+    data = {
+        'meta' : {
+            'revision' : git_revision(),
+            'python' : platform.python_version(),
+            'platform' : platform.platform(),
+            'timestamp' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat' : args.repeat,
+            'warm_cache' : args.warm_cache,
+        },
+        'results' : results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for size, stage, old, new in regressions:
+            print(f"REGRESSION {stage} at {size} sentences: {old:.4f}s -> {new:.4f}s", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
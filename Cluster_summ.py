@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+import random
+import sys
+import zlib
+
+from Auto_text_summ import *
+from Idf_index import IdfIndex
+from Stream_summ import StreamStatistics
+from Summ_cache import IndicatorCache
+
+# разобранный документ кластера
+ClusterDocument = namedtuple('ClusterDocument', ['sentences', 'stemmed', 'indicators'])
+
+# анализ документа (может выполняться в рабочем процессе)
+def analyze_document(summarizer, raw_text, indicators = True, adj = False):
+    """
+    Разбивает документ на абзацы и предложения, выполняет морфологический
+    анализ и, если indicators, применяет шаблоны аспектов. От остальных
+    документов кластера эти шаги не зависят. Возвращается ClusterDocument:
+    предложения и пары (стема, слово) без стоп-слов, сгруппированные
+    по абзацам, и для каждого предложения пара (коэффициент индикаторов,
+    кортеж аспектов) (см. countIndicatorWeights(); если у summarizer
+    задан indicator_cache, повторяющиеся предложения берутся из него).
+    """
+    if summarizer.tokenizer is None:
+        text = StructuredText(text_segmentor(raw_text))
+        tokenized = text.map_sent(lambda sentence: analyze_sentence(sentence, summarizer.check))
+    else:
+        segmented = summarizer.tokenizer.segment(raw_text)
+        text = StructuredText([[sentence for sentence, _ in paragraph] for paragraph in segmented])
+        tokenized = [[analyze_words(words, summarizer.tokenizer.check) for _, words in paragraph]
+                     for paragraph in segmented]
+    stemmed = [[[(token.stem, token.word) for token in tokens if not token.stop] for tokens in paragraph]
+               for paragraph in tokenized]
+    if indicators:
+        indicator_weights = countIndicatorWeights(
+            adj, text.sentences(), list(itertools.chain.from_iterable(tokenized)),
+            cache = summarizer.indicator_cache, tokenizer = 'nltk' if summarizer.tokenizer is None else 'regex',
+            time_budget = summarizer.time_budget)
+    else:
+        indicator_weights = [(1, ())] * text.len
+    return ClusterDocument(text.text, stemmed, indicator_weights)
+
+# рабочий процесс анализа документов
+_worker = {}
+
+def init_worker(indicators = True, adj = False, tokenizer = 'nltk', indicator_cache_path = None, time_budget = None):
+    indicator_cache = IndicatorCache(path=indicator_cache_path) if indicator_cache_path else None
+    _worker['summarizer'] = SUMMARIZER(tokenizer=tokenizer, indicator_cache=indicator_cache, time_budget=time_budget)
+    _worker['params'] = (indicators, adj)
+    # кэш морфологии сохраняется при завершении процесса, если задан MORPH_CACHE_PATH
+    morph_cache.persist_at_exit()
+    resources.warmup()
+    if indicators:
+        template_registry.get(template_set_name(adj))
+
+def analyze_worker(raw_text):
+    return analyze_document(_worker['summarizer'], raw_text, *_worker['params'])
+
+# поиск почти повторяющихся предложений
+class MinHashLSH():
+    """
+    Сигнатуры MinHash множеств стем предложений и индекс LSH по ним:
+    сигнатура из num_perm значений делится на bands полос, предложения
+    с совпадающей полосой становятся кандидатами в дубликаты. Значения
+    хэш-функций стемы (crc32 и num_perm линейных перестановок по модулю
+    простого числа) вычисляются один раз на стему, поэтому сигнатура
+    предложения - поэлементный минимум по его стемам. Хэши не зависят
+    от процесса и запуска (в отличие от hash()).
+    """
+    prime = (1 << 61) - 1
+
+    def __init__(self, num_perm = 64, bands = 16, seed = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        rng = random.Random(seed)
+        self.permutations = [(rng.randrange(1, self.prime), rng.randrange(self.prime)) for _ in range(num_perm)]
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.stem_hashes = {}
+        self.buckets = [{} for _ in range(bands)]
+
+    def hashes(self, stem):
+        values = self.stem_hashes.get(stem)
+        if values is None:
+            key = zlib.crc32(stem.encode('utf-8'))
+            values = self.stem_hashes[stem] = tuple((a * key + b) % self.prime for a, b in self.permutations)
+        return values
+
+    def signature(self, stems):
+        return tuple(map(min, zip(*map(self.hashes, stems))))
+
+    def add(self, key, signature):
+        rows = self.rows
+        for band, bucket in enumerate(self.buckets):
+            bucket.setdefault(signature[band*rows:(band+1)*rows], []).append(key)
+
+    def candidates(self, signature):
+        rows = self.rows
+        found = set()
+        for band, bucket in enumerate(self.buckets):
+            found.update(bucket.get(signature[band*rows:(band+1)*rows], ()))
+        return found
+
+# реферирование кластера документов
+class ClusterSummarizer():
+    """
+    Один реферат для кластера документов об одном событии. Каждый документ
+    разбирается отдельно (при workers != 1 - пулом процессов), затем
+    статистика терминов объединяется по всему кластеру: частоты стем,
+    стемы первых/последних и вопросительных/восклицательных предложений,
+    "имена собственные", количество предложений и стем. По общим весам
+    терминов каждый документ оценивается методом симметричного
+    реферирования (SymmetricalSummarizationWeightCount) - связи считаются
+    только внутри документа, поэтому время растет линейно с размером
+    кластера, а не квадратично, как при склеивании документов в один текст.
+
+    Перед отбором предложения просматриваются по убыванию веса, и предложение,
+    множество стем которого совпадает с уже оставленным не меньше чем на
+    threshold по мере Жаккара, отбрасывается; кандидаты в дубликаты
+    ищутся по MinHash/LSH (см. MinHashLSH), мера Жаккара проверяется точно.
+    """
+    def __init__(self, summarizer = None, workers = 1, threshold = 0.7, num_perm = 64, bands = 16):
+        self.summarizer = summarizer or SUMMARIZER()
+        self.workers = workers
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+
+    def analyze(self, texts, indicators = True, adj = False):
+        if self.workers == 1 or len(texts) < 2:
+            return [analyze_document(self.summarizer, text, indicators, adj) for text in texts]
+        workers = self.workers or os.cpu_count() or 1
+        tokenizer = 'nltk' if self.summarizer.tokenizer is None else 'regex'
+        # рабочие процессы используют файл кэша индикаторов, если он есть
+        indicator_cache = self.summarizer.indicator_cache
+        indicator_cache_path = indicator_cache.path if indicator_cache is not None else None
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(indicators, adj, tokenizer, indicator_cache_path,
+                                           self.summarizer.time_budget)) as executor:
+            return list(executor.map(analyze_worker, texts, chunksize=max(1, len(texts) // (workers * 4))))
+
+    def termWeights(self, documents):
+        """
+        Веса терминов по объединенной статистике кластера
+        (как countFinalWeights() для одного текста), накопленной
+        так же, как при потоковой обработке (см. Stream_summ.StreamStatistics);
+        связи между предложениями здесь не нужны и не считаются.
+        """
+        stats = StreamStatistics()
+        for document in documents:
+            for paragraph in document.stemmed:
+                for position, sentence in enumerate(paragraph):
+                    stats.add_sentence(Counter([stem for stem, _ in sentence]), sentence, position, len(paragraph),
+                                       links = False)
+
+        if stats.total_sents < 3:
+            raise TextTooShortError("Cluster should be at least 3 sentences long.")
+        if not stats.total_stems:
+            raise NoTermsError("There are no words to process!")
+        tf_dict = stats.term_weights(self.summarizer.idf)
+        return sorted(tf_dict.items(), key=lambda w: w[1], reverse=True), stats.stemmed_pnn
+
+    def rank(self, texts, indicators = True, adj = False, aspect_hits = None):
+        """
+        Возвращает отсортированный по убыванию веса список предложений
+        всех документов [(sentence, weight, (документ, номер)), ...];
+        номер предложения считается внутри документа, поэтому функции
+        выборки (selectFinalSents(), selectByBudget()) упорядочивают
+        реферат по документам и позициям в них.
+        """
+        documents = self.analyze(texts, indicators, adj)
+        sorted_tfidf, stemmed_pnn = self.termWeights(documents)
+        symmetry = self.summarizer.symmetry
+        result = []
+        for number, document in enumerate(documents):
+            sentences = list(itertools.chain.from_iterable(document.stemmed))
+            if not sentences:
+                continue
+            counters = [Counter([stem for stem, _ in sentence]) for sentence in sentences]
+            weights = symmetry.countFinalSymmetryWeight(
+                sorted_tfidf, counters, sum(map(len, sentences)), len(sentences), stemmed_pnn,
+                [len(paragraph) for paragraph in document.stemmed])
+            originals = itertools.chain.from_iterable(document.sentences)
+            for index, ((counter, weight), original, (weight_indicator, hits)) in enumerate(
+                    zip(weights, originals, document.indicators)):
+                if hits and aspect_hits is not None:
+                    aspect_hits[(number, index)] = hits
+                if len(counter) > 6:
+                    result.append((original, weight * weight_indicator if indicators else weight,
+                                   (number, index), frozenset(counter)))
+        result.sort(key=lambda x: x[1], reverse=True)
+        return self.prune(result)
+
+    def prune(self, candidates):
+        """
+        Убирает почти повторяющиеся предложения из списка, отсортированного
+        по убыванию веса: остается предложение с большим весом.
+        Принимает четверки (sentence, weight, index, множество стем).
+        """
+        lsh = MinHashLSH(self.num_perm, self.bands)
+        kept = []
+        stems_of = {}
+        for sentence, weight, index, stems in candidates:
+            signature = lsh.signature(stems)
+            if any(len(stems & stems_of[other]) / len(stems | stems_of[other]) >= self.threshold
+                   for other in lsh.candidates(signature)):
+                continue
+            lsh.add(index, signature)
+            stems_of[index] = stems
+            kept.append((sentence, weight, index))
+        return kept
+
+    def summarize(self, texts, percentage = 10, sentences = None, characters = None,
+                  indicators = True, adj = False):
+        """
+        Реферат кластера: если задан бюджет (sentences и/или characters),
+        выборка по бюджету (selectByBudget()), иначе процентная
+        (selectFinalSents()) от числа предложений после удаления дубликатов.
+        """
+        ranked = self.rank(texts, indicators, adj)
+        if sentences is not None or characters is not None:
+            return selectByBudget(ranked, sentences, characters)
+        return selectFinalSents(ranked, percentage)
+
+
+def main(argv = None):
+    from Batch_summ import collect_inputs
+    parser = argparse.ArgumentParser(description="Summarize a cluster of documents as one summary.")
+    parser.add_argument('inputs', nargs='+', help="directories, glob masks or files")
+    parser.add_argument('-o', '--output', help="output file (default: stdout)")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="number of worker processes")
+    parser.add_argument('-p', '--percentage', type=float, default=10)
+    parser.add_argument('--sentences', type=int, default=None, help="sentence budget")
+    parser.add_argument('--characters', type=int, default=None, help="character budget")
+    parser.add_argument('--threshold', type=float, default=0.7, help="Jaccard similarity of near-duplicates")
+    parser.add_argument('--adj', action='store_true', help="use templates_2")
+    parser.add_argument('--no-indicators', action='store_true', help="skip aspect templates")
+    parser.add_argument('--encoding', default=None, help="encoding of input files")
+    parser.add_argument('--idf', default=None, help="corpus IDF index built by Idf_index.py")
+    parser.add_argument('--indicator-cache', default=None, help="SQLite file for per-sentence template results")
+    parser.add_argument('--time-budget', type=float, default=1.0,
+                        help="seconds per sentence for all templates (0 or less: no limit)")
+    args = parser.parse_args(argv)
+
+    files = collect_inputs(args.inputs)
+    texts = []
+    for file_name in files:
+        with open(file_name, 'r', encoding=args.encoding) as file:
+            texts.append(file.read())
+    summarizer = SUMMARIZER(idf=IdfIndex(args.idf) if args.idf else None,
+                            indicator_cache=IndicatorCache(path=args.indicator_cache) if args.indicator_cache else None,
+                            time_budget=args.time_budget if args.time_budget > 0 else None)
+    cluster = ClusterSummarizer(summarizer, args.workers, args.threshold)
+    try:
+        selected = cluster.summarize(texts, args.percentage, args.sentences, args.characters,
+                                     not args.no_indicators, args.adj)
+    except SummarizationError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+
+    output_file = open(args.output, 'w', encoding=args.encoding) if args.output else sys.stdout
+    try:
+        for sentence, _, _ in selected:
+            output_file.write(sentence + '\n')
+    finally:
+        if args.output:
+            output_file.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from Morph_cache import morph_cache
+from Text_terms import analyze_sentence, text_segmentor
+
+# формат файла: заголовок, хэш-таблица, смещения стем, idf, стемы в utf-8
+MAGIC = b'IDFINDEX'
+HEADER = struct.Struct('<8sIIIIIf32s')
+VERSION = 1
+ENDIAN_MARK = 0x01020304
+
+# множество стем документа (без стоп-слов, как при подсчете весов)
+def document_stems(raw_text, check = None):
+    return {token.stem
+            for paragraph in text_segmentor(raw_text)
+            for sentence in paragraph
+            for token in analyze_sentence(sentence, check)
+            if not token.stop}
+
+# рабочий процесс индексатора
+_worker = {}
+
+def init_worker(encoding = None):
+    from Auto_text_summ import SUMMARIZER
+    _worker['check'] = SUMMARIZER().check
+    _worker['encoding'] = encoding
+    # кэш морфологии сохраняется при завершении процесса, если задан MORPH_CACHE_PATH
+    morph_cache.persist_at_exit()
+
+def read_document(file_name):
+    """
+    Возвращает множество стем документа или None,
+    если файл не удалось прочитать или декодировать.
+    """
+    try:
+        with open(file_name, 'r', encoding=_worker['encoding']) as file:
+            raw_text = file.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+    return document_stems(raw_text, _worker['check'])
+
+# запись индекса
+def write_index(path, document_freqs, num_docs):
+    """
+    Записывает индекс: стемы в порядке возрастания (в байтах utf-8),
+    массив idf (float32) в том же порядке и хэш-таблицу с открытой
+    адресацией (crc32 стемы -> номер стемы + 1) не менее чем
+    вдвое больше числа стем. idf = ln((N + 1) / (df + 1)) + 1;
+    для стем, которых нет в корпусе, используется значение при df = 0.
+    """
+    stems = sorted(stem.encode('utf-8') for stem in document_freqs)
+    table_size = 1
+    while table_size < 2 * len(stems):
+        table_size *= 2
+    table = array('I', bytes(4 * table_size))
+    offsets = array('I', [0])
+    idf = array('f')
+    for position, key in enumerate(stems):
+        slot = zlib.crc32(key) & (table_size - 1)
+        while table[slot]:
+            slot = (slot + 1) & (table_size - 1)
+        table[slot] = position + 1
+        offsets.append(offsets[-1] + len(key))
+        idf.append(math.log((num_docs + 1) / (document_freqs[key.decode('utf-8')] + 1)) + 1)
+    payload = table.tobytes() + offsets.tobytes() + idf.tobytes() + b''.join(stems)
+    header = HEADER.pack(MAGIC, VERSION, ENDIAN_MARK, num_docs, len(stems), table_size,
+                         math.log(num_docs + 1) + 1, hashlib.sha256(payload).digest())
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as file:
+        file.write(header)
+        file.write(payload)
+    os.replace(tmp_path, path)
+
+# построение индекса по корпусу
+def build_index(sources, output_name, workers = None, encoding = None, report = None):
+    """
+    Считает документные частоты стем по всем документам корпуса
+    (каталоги, маски glob или файлы, см. Batch_summ.collect_inputs())
+    пулом процессов и записывает индекс в output_name.
+    report(documents) вызывается каждые 1000 документов.
+    Нечитаемые файлы и файлы не в кодировке encoding пропускаются
+    и не учитываются в числе документов индекса.
+    Возвращается словарь {'documents': проиндексировано, 'skipped': пропущено}.
+    """
+    from Batch_summ import collect_inputs
+    files = collect_inputs(sources)
+    document_freqs = {}
+    stats = {'documents' : 0, 'skipped' : 0}
+    if workers == 1:
+        init_worker(encoding)
+        results = map(read_document, files)
+        executor = None
+    else:
+        workers = workers or os.cpu_count() or 1
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(encoding,))
+        results = executor.map(read_document, files, chunksize=max(1, len(files) // (workers * 16)))
+    try:
+        for stems in results:
+            if stems is None:
+                stats['skipped'] += 1
+                continue
+            for stem in stems:
+                document_freqs[stem] = document_freqs.get(stem, 0) + 1
+            stats['documents'] += 1
+            if report is not None and stats['documents'] % 1000 == 0:
+                report(stats['documents'])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    write_index(output_name, document_freqs, stats['documents'])
+    return stats
+
+# индекс idf, отображенный в память
+class IdfIndex():
+    """
+    Индекс обратных документных частот, открываемый через mmap без
+    разбора: все процессы, открывшие один файл, делят его страницы.
+    Поиск стемы - хэш crc32 и проверка нескольких соседних ячеек таблицы,
+    т.е. O(1) в среднем. digest - хэш содержимого индекса (для ключей кэша).
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, endian_mark, self.num_docs, self.num_stems, table_size, \
+            self.default, digest = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not an IDF index of version {VERSION}")
+        if endian_mark != ENDIAN_MARK:
+            raise ValueError(f"{path} was built on a machine with a different byte order")
+        self.digest = digest.hex()
+        self.mask = table_size - 1
+        view = memoryview(self.mm)
+        start = HEADER.size
+        self.table = view[start:start + 4 * table_size].cast('I')
+        start += 4 * table_size
+        self.offsets = view[start:start + 4 * (self.num_stems + 1)].cast('I')
+        start += 4 * (self.num_stems + 1)
+        self.idf = view[start:start + 4 * self.num_stems].cast('f')
+        start += 4 * self.num_stems
+        self.blob = view[start:]
+
+    def position(self, stem):
+        key = stem.encode('utf-8')
+        slot = zlib.crc32(key) & self.mask
+        while True:
+            position = self.table[slot]
+            if not position:
+                return -1
+            if self.blob[self.offsets[position - 1]:self.offsets[position]] == key:
+                return position - 1
+            slot = (slot + 1) & self.mask
+
+    def get(self, stem, default = None):
+        position = self.position(stem)
+        if position < 0:
+            return self.default if default is None else default
+        return self.idf[position]
+
+    def __getitem__(self, stem):
+        return self.get(stem)
+
+    def __contains__(self, stem):
+        return self.position(stem) >= 0
+
+    def __len__(self):
+        return self.num_stems
+
+    def stems(self):
+        for position in range(self.num_stems):
+            yield bytes(self.blob[self.offsets[position]:self.offsets[position + 1]]).decode('utf-8')
+
+    def weigh(self, tf_weights):
+        """
+        Умножает относительные частоты терминов текста на их idf.
+        """
+        return {term : weight * self.get(term) for term, weight in tf_weights.items()}
+
+    def close(self):
+        for view in (self.table, self.offsets, self.idf, self.blob):
+            view.release()
+        self.mm.close()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Build a corpus IDF index for the summarizer.")
+    parser.add_argument('inputs', nargs='+', help="directories, glob masks or files")
+    parser.add_argument('-o', '--output', required=True, help="index file")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--encoding', default=None, help="encoding of input files")
+    args = parser.parse_args(argv)
+
+    def report(documents):
+        print(f"{documents} documents", file=sys.stderr)
+
+    stats = build_index(args.inputs, args.output, args.workers, args.encoding, report)
+    index = IdfIndex(args.output)
+    print(f"{stats['documents']} documents, {len(index)} stems, skipped: {stats['skipped']}", file=sys.stderr)
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+
+from Auto_text_summ import *
+from Stream_summ import StreamStatistics
+
+# инкрементальный суммаризатор растущего текста
+class IncrementalSummarizer():
+    """
+    Реферирование текста, который дописывается абзацами (стенограммы,
+    онлайн-трансляции). Каждый добавленный абзац токенизируется,
+    разбирается и проверяется шаблонами аспектов один раз; для него
+    обновляется та же сводная статистика, что и при потоковой обработке
+    (см. Stream_summ.StreamStatistics): частоты стем, стемы первых/последних
+    и вопросительных/восклицательных предложений, "имена собственные",
+    гистограммы частот терминов по предложениям. Связи предложения
+    влево не меняются при дописывании текста и считаются один раз,
+    связи вправо - по гистограммам всего текста, суммы по которым
+    пересчитываются только для терминов, встретившихся в новых абзацах.
+
+    Относительные частоты терминов и поправки весов зависят от всего
+    текста, поэтому при запросе реферата веса предложений, которые
+    могут в него попасть (больше 6 терминов), пересчитываются,
+    но без повторного разбора текста и шаблонов. Результат rank()
+    совпадает с SUMMARIZER.rank() для всего накопленного текста
+    (tokenizer и template_pool суммаризатора учитываются; окно
+    и engine 'numpy' не поддерживаются и вызывают ValueError).
+    """
+    def __init__(self, summarizer = None, indicators = True, adj = False):
+        self.summarizer = summarizer or SUMMARIZER()
+        self.symmetry = self.summarizer.symmetry
+        if self.symmetry.window is not None:
+            # связи вправо считаются по гистограммам всего текста
+            raise ValueError("Incremental summarization supports the exact mode only")
+        if self.summarizer.engine != 'python':
+            raise ValueError("Incremental summarization supports the python engine only")
+        self.indicators = indicators
+        self.adj = adj
+        self.stats = StreamStatistics()
+        # по предложениям: текст, словарь частот стем, связи влево, (коэффициент индикаторов, аспекты)
+        self.sentences = []
+        self.counters = []
+        self.left_links = []
+        self.indicator_weights = []
+        # термин -> {частота в предложении: сумма max(частота, c') по всем предложениям}
+        self.link_sums = {}
+        self.changed_terms = set()
+        self.ranked = None
+
+    def segments(self, text):
+        """
+        Генератор абзацев text: списки пар (предложение, токены Token),
+        разбитые так же, как в SUMMARIZER.rankText().
+        """
+        tokenizer = self.summarizer.tokenizer
+        if tokenizer is None:
+            for paragraph in iter_segments(text.splitlines()):
+                yield [(sentence, analyze_sentence(sentence, self.summarizer.check)) for sentence in paragraph]
+        else:
+            for paragraph in tokenizer.segment(text):
+                if paragraph:
+                    yield [(sentence, analyze_words(words, tokenizer.check)) for sentence, words in paragraph]
+
+    def append(self, text):
+        """
+        Добавляет в конец текста один или несколько абзацев (каждая
+        непустая строка text - новый абзац, как в text_segmentor()).
+        Возвращается количество добавленных предложений.
+        """
+        added = 0
+        new_sents = []
+        new_tokens = []
+        for paragraph in self.segments(text):
+            for position, (sentence, tokens) in enumerate(paragraph):
+                pairs = [(token.stem, token.word) for token in tokens if not token.stop]
+                counter = Counter([pair[0] for pair in pairs])
+                # связи влево - с уже добавленными предложениями, дальше не меняются
+                left_links = self.stats.add_sentence(counter, pairs, position, len(paragraph))
+                self.changed_terms.update(counter)
+
+                if self.indicators:
+                    new_sents.append(sentence)
+                    new_tokens.append(tokens)
+                else:
+                    self.indicator_weights.append((1, ()))
+                self.sentences.append(sentence)
+                self.counters.append(counter)
+                self.left_links.append(left_links)
+                added += 1
+        if new_sents:
+            summarizer = self.summarizer
+            self.indicator_weights.extend(countIndicatorWeights(
+                self.adj, new_sents, new_tokens, summarizer.template_pool, summarizer.template_chunk_size,
+                summarizer.indicator_cache, 'nltk' if summarizer.tokenizer is None else 'regex',
+                time_budget = summarizer.time_budget))
+        if added:
+            self.ranked = None
+        return added
+
+    def updateLinkSums(self):
+        histograms = self.stats.histograms
+        for word in self.changed_terms:
+            histogram = histograms[word]
+            self.link_sums[word] = {
+                count : sum(max(count, value) * number for value, number in histogram.items())
+                for count in histogram }
+        self.changed_terms.clear()
+
+    def rank(self):
+        """
+        Возвращает отсортированный по убыванию веса список предложений
+        [(sentence, weight, index), ...], как SUMMARIZER.rank() для всего
+        добавленного текста. Результат хранится до следующего append().
+        """
+        if self.ranked is not None:
+            return list(self.ranked)
+        stats = self.stats
+        if stats.total_sents < 3:
+            raise TextTooShortError("Text should be at least 3 sentences long.")
+        if not stats.total_stems:
+            raise NoTermsError("There are no words to process!")
+
+        tf_dict = stats.term_weights(self.summarizer.idf)
+        asl = stats.total_stems / stats.total_sents
+        self.updateLinkSums()
+        link_sums = self.link_sums
+
+        result = []
+        for index, (sentence, counter, left_links, (weight_indicator, _)) in enumerate(
+                zip(self.sentences, self.counters, self.left_links, self.indicator_weights)):
+            if len(counter) <= 6:
+                continue
+            own_weight = sum(tf_dict.get(word, 0)*count for word, count in counter.items())
+            # сумма по всем остальным предложениям минус связи влево
+            right_links = sum(link_sums[word][count] - count for word, count in counter.items()) - left_links
+            pscore = 10 / (index+1)
+            weight = (own_weight + left_links + pscore) + (own_weight + right_links + pscore)
+            weight = self.symmetry.adjustSentenceWeight(counter, weight, asl, stats.stemmed_pnn)
+            if self.indicators:
+                weight = weight * weight_indicator
+            result.append((sentence, weight, index))
+        self.ranked = sorted(result, key=lambda x: x[1], reverse=True)
+        return list(self.ranked)
+
+    def aspects(self):
+        """
+        Аспекты, найденные в предложениях: {номер: (аспект, ...)}.
+        """
+        return {index : hits for index, (_, hits) in enumerate(self.indicator_weights) if hits}
+
+    def summarize(self, percentage = 10):
+        """
+        Текущий реферат: процентная выборка (см. selectFinalSents())
+        в порядке следования предложений в тексте.
+        """
+        return selectFinalSents(self.rank(), percentage)
+
+    def top(self, n):
+        """
+        Текущий реферат из n предложений с наибольшим весом
+        в порядке следования в тексте.
+        """
+        # при равных весах выше стоит более раннее предложение, как при устойчивой сортировке
+        best = heapq.nsmallest(n, self.rank(), key=lambda x: (-x[1], x[2]))
+        return sorted(best, key=lambda w: w[2])
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+from Resources import resources
+
+from collections import OrderedDict, namedtuple
+import multiprocessing.util
+import os
+import pickle
+
+# результат анализа словоформы: стема (для подсчета весов), часть речи LSPL и лемма (для шаблонов)
+MorphRecord = namedtuple('MorphRecord', ['stem', 'pos', 'lemma'])
+
+class Translator():
+    def __init__(self):
+        self.pm2lspl_pos = {
+            'NOUN' : 'N',   #существительное
+            'ADJF' : 'A',   #прилагательное(полное)
+            'ADJS' : 'A',   #прилагательное(краткое)
+            'COMP' : 'A',   #компаратив
+            'VERB' : 'V',   #глагол(личная', #форма)
+            'INFN' : 'V',   #глагол(инфинитив)
+            'PRTF' : 'Pa',  #причастие(полное)
+            'PRTS' : 'Pa',  #причастие(краткое)
+            'GRND' : 'Ap',  #деепричастие
+            'NUMR' : 'Num', #числительное
+            'ADVB' : 'Av',  #наречие
+            'NPRO' : 'Pn',  #местоимение
+            'PRED' : 'Av',  #предикатив
+            'PREP' : 'Pr',  #предлог
+            'CONJ' : 'Cn',  #союз
+            'PRCL' : 'Pt',  #частица
+            'INTJ' : 'Int', #междометие
+        }
+
+    def apply(self, parsed):
+        pos = parsed.tag.POS
+        return (None, parsed.normal_form) \
+          if pos is None \
+          else (self.pm2lspl_pos[pos], parsed.normal_form)
+
+# кэш морфологического анализа
+class MorphCache():
+    """
+    Ограниченный кэш морфологического анализа словоформ с вытеснением
+    давно не использовавшихся записей (LRU). Ключ - словоформа в том виде,
+    в каком она встретилась в тексте. Для каждой словоформы хранится
+    стема нормальной формы (как в normalize()) и часть речи LSPL с леммой
+    (как в TextProcessor.parse()), так что оба модуля разбирают каждую
+    словоформу не более одного раза.
+    Кэш может сохраняться на диск и загружаться при создании,
+    если указан путь к файлу; после persist_at_exit() он сохраняется
+    при завершении процесса. Анализатор и стеммер берутся из общего
+    хранилища Resources и загружаются при первом промахе кэша.
+    """
+    def __init__(self, maxsize=200000, path=None, resources=resources):
+        self.maxsize = maxsize
+        self.path = path
+        self.records = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.resources = resources
+        self.translator = Translator()
+        self.finalizer = None
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    @property
+    def morph(self):
+        return self.resources.morph
+
+    @property
+    def stemmer(self):
+        return self.resources.stemmer
+
+    def analyze(self, word):
+        parsed = self.morph.parse(word)[0]
+        stem = self.stemmer.stem(parsed.normal_form)
+        pos, lemma = self.translator.apply(self.morph.parse(parsed.normal_form)[0])
+        return MorphRecord(stem, pos, lemma)
+
+    def lookup(self, word):
+        record = self.records.get(word)
+        if record is not None:
+            self.hits += 1
+            self.records.move_to_end(word)
+            return record
+        self.misses += 1
+        record = self.analyze(word)
+        self.records[word] = record
+        if len(self.records) > self.maxsize:
+            self.records.popitem(last=False)
+        return record
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        self.records.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def save(self, path=None, merge=False):
+        """
+        Записи сохраняются в порядке от давно использованных
+        к недавно использованным, чтобы при загрузке сохранился порядок вытеснения.
+        Если merge, записи уже сохраненного файла (например, другим
+        рабочим процессом) сохраняются как более давние.
+        Файл сначала пишется во временный и затем атомарно подменяется.
+        """
+        path = path or self.path
+        items = OrderedDict()
+        if merge:
+            try:
+                with open(path, 'rb') as file:
+                    items.update(pickle.load(file))
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+        for word, record in self.records.items():
+            items[word] = tuple(record)
+            items.move_to_end(word)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(list(items.items())[-self.maxsize:], file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def persist(self):
+        """
+        Сохраняет кэш в path (см. save(merge=True)), если путь задан
+        и с момента загрузки были промахи, т.е. новые записи.
+        """
+        if self.path is not None and self.misses:
+            self.save(merge=True)
+
+    def persist_at_exit(self):
+        """
+        Вызывает persist() при нормальном завершении процесса, в том числе
+        рабочего процесса пула (ProcessPoolExecutor), где atexit не работает.
+        Повторные вызовы в том же процессе ничего не делают.
+        """
+        if self.path is None or self.finalizer is not None and self.finalizer.still_active():
+            return
+        self.finalizer = multiprocessing.util.Finalize(None, self.persist, exitpriority=10)
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(path, 'rb') as file:
+            items = pickle.load(file)
+        for word, record in items[-self.maxsize:]:
+            self.records[word] = MorphRecord(*record)
+            self.records.move_to_end(word)
+        while len(self.records) > self.maxsize:
+            self.records.popitem(last=False)
+
+
+# общий для всех модулей кэш; путь для сохранения можно задать переменной окружения,
+# тогда кэш сохраняется при завершении процесса (рабочие процессы пулов - см. init_worker())
+morph_cache = MorphCache(path=os.environ.get('MORPH_CACHE_PATH'))
+morph_cache.persist_at_exit()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+# общие тяжелые ресурсы, загружаемые при первом обращении
+class Resources():
+    """
+    Хранилище тяжелых ресурсов, общих для всех модулей: морфологический
+    анализатор pymorphy2, стеммер и токенизаторы NLTK, список стоп-слов.
+    Импорт NLTK и pymorphy2 и загрузка словарей откладываются до первого
+    обращения к соответствующему атрибуту, поэтому импорт модулей
+    суммаризатора почти ничего не стоит и короткие запуски платят только
+    за то, что действительно используют. Долгоживущие процессы (серверы,
+    рабочие процессы пула) могут загрузить все сразу методом warmup().
+    Загрузка каждого ресурса выполняется не более одного раза,
+    в том числе при обращении из нескольких потоков.
+    """
+    def __init__(self, language = 'russian'):
+        self.language = language
+        self.lock = threading.RLock()
+        self.loaded = {}
+
+    def get(self, name, loader):
+        resource = self.loaded.get(name)
+        if resource is None:
+            with self.lock:
+                resource = self.loaded.get(name)
+                if resource is None:
+                    resource = self.loaded[name] = loader()
+        return resource
+
+    @property
+    def morph(self):
+        def loader():
+            import pymorphy2
+            return pymorphy2.MorphAnalyzer()
+        return self.get('morph', loader)
+
+    @property
+    def stemmer(self):
+        def loader():
+            from nltk.stem.snowball import RussianStemmer
+            return RussianStemmer()
+        return self.get('stemmer', loader)
+
+    @property
+    def stopwords(self):
+        def loader():
+            from nltk.corpus import stopwords
+            return frozenset(stopwords.words(self.language))
+        return self.get('stopwords', loader)
+
+    @property
+    def tokenizers(self):
+        def loader():
+            from nltk.tokenize import word_tokenize, sent_tokenize
+            return word_tokenize, sent_tokenize
+        return self.get('tokenizers', loader)
+
+    def word_tokenize(self, text):
+        return self.tokenizers[0](text)
+
+    def sent_tokenize(self, text, language = 'english'):
+        return self.tokenizers[1](text, language)
+
+    def warmup(self):
+        """
+        Загружает все ресурсы заранее, включая модель Punkt,
+        которую NLTK подгружает при первом разбиении на предложения.
+        """
+        self.morph.parse('слово')
+        self.stemmer.stem('слово')
+        self.stopwords
+        self.sent_tokenize('Первое предложение. Второе предложение.')
+        self.word_tokenize('Первое предложение.')
+        return self
+
+
+# общий для всех модулей экземпляр
+resources = Resources()
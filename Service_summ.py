@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from Auto_text_summ import *
+from Batch_summ import summarize_record
+from Summ_cache import SummaryCache, IndicatorCache
+from Idf_index import IdfIndex
+
+# суммаризатор рабочего процесса сервиса
+_worker = {}
+
+def init_worker(cache_path = None, idf_path = None, indicator_cache_path = None, time_budget = None):
+    """
+    Инициализация рабочего процесса: анализатор, стоп-слова, токенизаторы
+    и оба набора шаблонов загружаются один раз при запуске процесса.
+    Кэш результатов в памяти есть у каждого процесса; если задан
+    cache_path, процессы также используют общий кэш на диске.
+    Индекс idf (idf_path) отображается в память и общий для всех процессов.
+    Кэш результатов шаблонов по предложениям (indicator_cache_path)
+    тоже может быть общим файлом на диске. time_budget - время на проверку
+    предложения шаблонами (см. TextProcessor).
+    """
+    idf = IdfIndex(idf_path) if idf_path else None
+    indicator_cache = IndicatorCache(path=indicator_cache_path) if indicator_cache_path else None
+    _worker['summarizer'] = SUMMARIZER(cache=SummaryCache(path=cache_path), idf=idf,
+                                       indicator_cache=indicator_cache, time_budget=time_budget).warmup()
+    # кэш морфологии сохраняется при завершении процесса, если задан MORPH_CACHE_PATH
+    morph_cache.persist_at_exit()
+
+def summarize_batch(requests):
+    """
+    Реферирует пачку запросов в рабочем процессе. Каждый запрос - кортеж
+    (текст, indicators, adj, percentage), результат - список записей
+    summarize_record() в том же порядке.
+    """
+    summarizer = _worker['summarizer']
+    return [summarize_record(summarizer, text, indicators, adj, percentage)
+            for text, indicators, adj, percentage in requests]
+
+def ready():
+    return os.getpid()
+
+# очередь запросов переполнена
+class ServiceOverloaded(Exception):
+    pass
+
+# некорректный запрос клиента
+class BadRequest(Exception):
+    pass
+
+# сервис реферирования
+class SummarizationService():
+    """
+    Долгоживущий сервис реферирования: HTTP поверх TCP или Unix-сокета
+    на asyncio. SUMMARIZER, кэш морфологии и скомпилированные шаблоны
+    загружаются один раз в каждом процессе пула и остаются в памяти.
+    Запросы ставятся в очередь ограниченного размера; при переполнении
+    клиент сразу получает 503. Одновременно выполняется не больше
+    workers пачек (по одной на процесс). Пока все процессы заняты,
+    запросы накапливаются в очереди и уходят следующей пачкой
+    до batch_size текстов, так что при низкой нагрузке запрос не ждет
+    сборки пачки, а при высокой - уменьшаются накладные расходы на передачу
+    между процессами.
+
+    POST /summarize с телом JSON {"text": ..., "indicators": true,
+    "adj": false, "percentage": 10} возвращает запись
+    {"status": ..., "indices": [...], "summary": [...]}
+    (см. Batch_summ.summarize_record()), GET /health - состояние сервиса.
+
+    Если рабочий процесс завершился аварийно (BrokenProcessPool), пул
+    создается заново, как в Batch_summ.summarize_pool(), а запросы пачки,
+    на которой это обнаружено, повторяются по одному; запрос, на котором
+    процесс падает и при повторе, получает запись со статусом error.
+    Пока пул пересоздается или не запустился, /health отвечает 503
+    со статусом 'degraded'.
+    """
+    def __init__(self, workers = None, batch_size = 8, queue_size = 256,
+                 timeout = None, max_body = 16 * 2**20, cache_path = None, idf_path = None,
+                 indicator_cache_path = None, time_budget = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.max_body = max_body
+        self.cache_path = cache_path
+        self.idf_path = idf_path
+        self.indicator_cache_path = indicator_cache_path
+        self.time_budget = time_budget
+        self.executor = None
+        self.queue = None
+        self.slots = None
+        self.batcher_task = None
+        # 'ok', 'rebuilding' (пул пересоздается) или 'broken' (пул не удалось запустить)
+        self.pool_state = 'ok'
+        self.pool_lock = None
+        self.stats = {'requests' : 0, 'batches' : 0, 'rejected' : 0, 'timeouts' : 0, 'restarts' : 0}
+
+    async def create_executor(self):
+        """
+        Запускает пул процессов и дожидается их инициализации,
+        чтобы запросы не платили за загрузку ресурсов.
+        """
+        loop = asyncio.get_running_loop()
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                       initargs=(self.cache_path, self.idf_path,
+                                                 self.indicator_cache_path, self.time_budget))
+        try:
+            await asyncio.gather(*(loop.run_in_executor(executor, ready) for _ in range(self.workers)))
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        return executor
+
+    async def restart(self, broken):
+        """
+        Заменяет пул broken новым. Пачки, обнаружившие падение одного
+        и того же пула одновременно, пересоздают его один раз.
+        """
+        async with self.pool_lock:
+            if self.executor is not broken and self.pool_state == 'ok':
+                return
+            self.pool_state = 'rebuilding'
+            self.stats['restarts'] += 1
+            await asyncio.get_running_loop().run_in_executor(None, broken.shutdown)
+            try:
+                self.executor = await self.create_executor()
+            except Exception:
+                self.pool_state = 'broken'
+                raise
+            self.pool_state = 'ok'
+
+    async def start(self):
+        self.pool_lock = asyncio.Lock()
+        self.executor = await self.create_executor()
+        self.queue = asyncio.Queue(self.queue_size)
+        self.slots = asyncio.Semaphore(self.workers)
+        self.batcher_task = asyncio.create_task(self.batcher())
+
+    async def stop(self):
+        if self.batcher_task is not None:
+            self.batcher_task.cancel()
+            try:
+                await self.batcher_task
+            except asyncio.CancelledError:
+                pass
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    async def summarize(self, text, indicators = True, adj = False, percentage = 10):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait(((text, indicators, adj, percentage), future))
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            raise ServiceOverloaded("Too many queued requests.")
+        self.stats['requests'] += 1
+        return await asyncio.wait_for(future, self.timeout)
+
+    async def batcher(self):
+        while True:
+            batch = [await self.queue.get()]
+            await self.slots.acquire()
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            # запросы, клиенты которых уже не ждут ответа, не выполняются
+            batch = [item for item in batch if not item[1].done()]
+            if batch:
+                asyncio.create_task(self.run_batch(batch))
+            else:
+                self.slots.release()
+
+    async def run_requests(self, requests):
+        executor = self.executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, summarize_batch, requests)
+        except BrokenProcessPool:
+            await self.restart(executor)
+            raise
+
+    async def run_batch(self, batch):
+        self.stats['batches'] += 1
+
+        def failed(error, count):
+            return [{'status' : 'error', 'indices' : [], 'summary' : [],
+                     'error' : f"{type(error).__name__}: {error}"}] * count
+
+        try:
+            try:
+                records = await self.run_requests([request for request, _ in batch])
+            except BrokenProcessPool:
+                # пул пересоздан; запросы пачки повторяются по одному
+                records = []
+                for request, _ in batch:
+                    try:
+                        records.extend(await self.run_requests([request]))
+                    except Exception as error:
+                        records.extend(failed(error, 1))
+        except Exception as error:
+            records = failed(error, len(batch))
+        finally:
+            self.slots.release()
+        for (_, future), record in zip(batch, records):
+            if not future.done():
+                future.set_result(record)
+
+    def parse_request(self, body):
+        try:
+            params = json.loads(body.decode('utf-8'))
+        except (UnicodeDecodeError, ValueError) as error:
+            raise BadRequest(f"Invalid JSON: {error}")
+        if not isinstance(params, dict) or not isinstance(params.get('text'), str):
+            raise BadRequest("Request must be a JSON object with a 'text' string.")
+        indicators = params.get('indicators', True)
+        adj = params.get('adj', False)
+        percentage = params.get('percentage', 10)
+        if not isinstance(indicators, bool) or not isinstance(adj, bool):
+            raise BadRequest("'indicators' and 'adj' must be booleans.")
+        if isinstance(percentage, bool) or not isinstance(percentage, (int, float)) \
+                or not 0 <= percentage <= 100:
+            raise BadRequest("'percentage' must be a number from 0 to 100.")
+        return params['text'], indicators, adj, percentage
+
+    async def dispatch(self, method, target, body):
+        path = target.split('?', 1)[0]
+        if path == '/health':
+            if method != 'GET':
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error' : "Use GET."}
+            healthy = self.pool_state == 'ok'
+            return HTTPStatus.OK if healthy else HTTPStatus.SERVICE_UNAVAILABLE, \
+                dict(self.stats, status='ok' if healthy else 'degraded', pool=self.pool_state,
+                     workers=self.workers, queued=self.queue.qsize())
+        if path != '/summarize':
+            return HTTPStatus.NOT_FOUND, {'error' : f"Unknown path: {path}"}
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error' : "Use POST."}
+        try:
+            record = await self.summarize(*self.parse_request(body))
+        except BadRequest as error:
+            return HTTPStatus.BAD_REQUEST, {'error' : str(error)}
+        except ServiceOverloaded as error:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {'error' : str(error)}
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            return HTTPStatus.GATEWAY_TIMEOUT, {'error' : "Summarization timed out."}
+        if record['status'] == 'error':
+            return HTTPStatus.INTERNAL_SERVER_ERROR, record
+        return HTTPStatus.OK, record
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        """
+        Обработка соединения: простой разбор HTTP/1.0 и HTTP/1.1
+        с поддержкой keep-alive. Тело запроса передается только
+        с заголовком Content-Length.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, HTTPStatus.BAD_REQUEST, {'error' : "Malformed request line."}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= self.max_body:
+                    await self.respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE if length > 0
+                                       else HTTPStatus.BAD_REQUEST, {'error' : "Invalid Content-Length."}, False)
+                    break
+                body = await reader.readexactly(length)
+                status, payload = await self.dispatch(method, target, body)
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host = '127.0.0.1', port = 8080, path = None, started = None):
+        """
+        Запускает сервис на TCP-порту или, если задан path, на Unix-сокете
+        и обслуживает запросы до отмены. started(service) вызывается,
+        когда сервис готов принимать запросы.
+        """
+        await self.start()
+        try:
+            if path is not None:
+                server = await asyncio.start_unix_server(self.handle, path=path)
+            else:
+                server = await asyncio.start_server(self.handle, host, port)
+            async with server:
+                if started is not None:
+                    started(self)
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Summarization service over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', help="listen on a Unix socket instead of TCP")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('-b', '--batch-size', type=int, default=8, help="texts per worker call")
+    parser.add_argument('-q', '--queue-size', type=int, default=256, help="queued requests before 503")
+    parser.add_argument('-t', '--timeout', type=float, default=None, help="seconds per request before 504")
+    parser.add_argument('--cache', default=None, help="SQLite file for the result cache")
+    parser.add_argument('--idf', default=None, help="corpus IDF index built by Idf_index.py")
+    parser.add_argument('--indicator-cache', default=None, help="SQLite file for per-sentence template results")
+    parser.add_argument('--time-budget', type=float, default=1.0,
+                        help="seconds per sentence for all templates (0 or less: no limit)")
+    args = parser.parse_args(argv)
+
+    service = SummarizationService(args.workers, args.batch_size, args.queue_size, args.timeout,
+                                   cache_path=args.cache, idf_path=args.idf,
+                                   indicator_cache_path=args.indicator_cache,
+                                   time_budget=args.time_budget if args.time_budget > 0 else None)
+
+    def started(service):
+        address = args.unix or f"http://{args.host}:{args.port}"
+        print(f"Serving on {address} with {service.workers} workers", file=sys.stderr)
+
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix, started))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+
+from Auto_text_summ import *
+
+# сводная статистика текста, накопленная за первый проход
+class StreamStatistics():
+    __slots__ = ('stem_counts', 'histograms', 'first_last_stems', 'q_excl_stems',
+                 'num_of_q_excl_sents', 'stemmed_pnn', 'total_sents', 'total_stems',
+                 'eligible_sents')
+
+    def __init__(self):
+        self.stem_counts = Counter()
+        # термин -> {частота в предложении: количество таких предложений}
+        self.histograms = {}
+        self.first_last_stems = set()
+        self.q_excl_stems = set()
+        self.num_of_q_excl_sents = 0
+        self.stemmed_pnn = set()
+        self.total_sents = 0
+        self.total_stems = 0
+        # количество предложений, которые могут попасть в реферат (больше 6 терминов)
+        self.eligible_sents = 0
+
+    def add_sentence(self, counter, pairs, position, paragraph_len, links = True):
+        """
+        Учитывает следующее предложение текста: counter - частоты его стем,
+        pairs - пары (стема, слово) без стоп-слов, position - номер
+        предложения в абзаце из paragraph_len предложений.
+        Возвращается сумма связей предложения влево, т.е. с уже
+        учтенными предложениями (см. countLinks()). Если links ложно,
+        гистограммы частот не ведутся и связи не считаются (возвращается
+        None) - этого достаточно для term_weights().
+        """
+        self.total_sents += 1
+        self.total_stems += len(pairs)
+        self.stem_counts.update(counter)
+        left_links = None
+        if links:
+            left_links = 0
+            for word, count in counter.items():
+                histogram = self.histograms.setdefault(word, {})
+                left_links += sum(max(count, value) * number for value, number in histogram.items())
+                histogram[count] = histogram.get(count, 0) + 1
+        if position == 0 or position == paragraph_len - 1:
+            self.first_last_stems.update(counter)
+        if pairs and pairs[-1][0] in {'?', '!'}:
+            self.num_of_q_excl_sents += 1
+            self.q_excl_stems.update(word for word in counter if word not in '?!')
+        self.stemmed_pnn |= lookForProper([[pairs]])
+        if len(counter) > 6:
+            self.eligible_sents += 1
+        return left_links
+
+    def term_weights(self, idf = None):
+        """
+        Веса терминов по накопленной статистике (см. countTermWeights());
+        idf - индекс Idf_index.IdfIndex, как в SUMMARIZER.
+        """
+        tf_weights = dict(countTermFreqs(self.stem_counts))
+        if idf is not None:
+            tf_weights = idf.weigh(tf_weights)
+        return countTermWeights(
+            tf_weights,
+            self.first_last_stems,
+            self.q_excl_stems,
+            self.num_of_q_excl_sents,
+            self.total_sents,
+            self.total_stems,
+            self.stemmed_pnn)
+
+# потоковый суммаризатор
+class StreamingSummarizer():
+    """
+    Реферирование больших файлов с ограниченным расходом памяти.
+    Файл читается построчно (абзацами, как в text_segmentor()) дважды.
+    За первый проход накапливается только статистика терминов:
+    частоты стем, стемы первых/последних и вопросительных/восклицательных
+    предложений, "имена собственные" и гистограммы частот каждого
+    термина по предложениям. За второй проход веса предложений
+    считаются так же, как в SUMMARIZER.rank(): связи влево - по
+    гистограммам уже пройденных предложений, связи вправо - как разность
+    с гистограммами всего текста, поэтому симметричные веса точные.
+    В памяти хранится только куча из k лучших предложений.
+    Настройки SUMMARIZER, которые здесь не поддерживаются (окно, engine
+    'numpy', tokenizer 'regex', template_pool), вызывают ValueError,
+    чтобы результат не расходился с SUMMARIZER.rank() незаметно.
+    """
+    def __init__(self, summarizer = None, encoding = None):
+        self.summarizer = summarizer or SUMMARIZER()
+        self.symmetry = self.summarizer.symmetry
+        if self.symmetry.window is not None:
+            # связи вправо считаются по гистограммам всего текста, окно для них недоступно
+            raise ValueError("Streaming summarization supports the exact mode only")
+        if self.summarizer.engine != 'python':
+            raise ValueError("Streaming summarization supports the python engine only")
+        if self.summarizer.tokenizer is not None:
+            raise ValueError("Streaming summarization supports the nltk tokenizer only")
+        if self.summarizer.template_pool is not None:
+            # шаблоны применяются к каждому предложению по ходу второго прохода
+            raise ValueError("Streaming summarization does not use a template pool")
+        self.encoding = encoding
+
+    def sentences(self, file_name):
+        """
+        Генератор предложений файла: (номер в абзаце, длина абзаца,
+        предложение, токены Token, пары (стема, слово) без стоп-слов).
+        """
+        with open(file_name, 'r', encoding=self.encoding) as file:
+            for paragraph in iter_segments(file):
+                for position, sentence in enumerate(paragraph):
+                    tokens = analyze_sentence(sentence, self.summarizer.check)
+                    pairs = [(token.stem, token.word) for token in tokens if not token.stop]
+                    yield position, len(paragraph), sentence, tokens, pairs
+
+    def collect(self, file_name):
+        stats = StreamStatistics()
+        for position, paragraph_len, _, _, pairs in self.sentences(file_name):
+            stats.add_sentence(Counter([pair[0] for pair in pairs]), pairs, position, paragraph_len)
+        return stats
+
+    def rank(self, file_name, indicators = True, adj = False, percentage = 10):
+        """
+        Возвращает отобранные по проценту предложения с наибольшим весом
+        в порядке убывания веса [(sentence, weight, index), ...], т.е. то начало
+        списка convertFinalWeights(), которое берет selectFinalSents().
+        Количество отбираемых предложений известно после первого прохода.
+        """
+        stats = self.collect(file_name)
+        if stats.total_sents < 3:
+            raise TextTooShortError("Text should be at least 3 sentences long.")
+        if not stats.total_stems:
+            raise NoTermsError("There are no words to process!")
+
+        tf_dict = stats.term_weights(self.summarizer.idf)
+        asl = stats.total_stems / stats.total_sents
+        k = int(stats.eligible_sents * percentage / 100 + 0.5)
+        processor = TextProcessor(flag = adj, time_budget = self.summarizer.time_budget) if indicators else None
+
+        # гистограммы частот терминов в уже пройденных предложениях
+        prefix = {}
+        heap = []
+        for index, (_, _, sentence, tokens, pairs) in enumerate(self.sentences(file_name)):
+            counter = Counter([pair[0] for pair in pairs])
+            own_weight = sum(tf_dict.get(word, 0)*count for word, count in counter.items())
+            left_links = right_links = 0
+            for word, count in counter.items():
+                seen = prefix.setdefault(word, {})
+                left = sum(max(count, value) * number for value, number in seen.items())
+                others = sum(max(count, value) * number
+                             for value, number in stats.histograms[word].items()) - count
+                left_links += left
+                right_links += others - left
+                seen[count] = seen.get(count, 0) + 1
+
+            if len(counter) <= 6 or k <= 0:
+                continue
+            pscore = 10 / (index+1)
+            weight = (own_weight + left_links + pscore) + (own_weight + right_links + pscore)
+            weight = self.symmetry.adjustSentenceWeight(counter, weight, asl, stats.stemmed_pnn)
+            if processor is not None:
+                _, parsed = next(processor.parse_tokens([tokens]))
+                weight *= countIndicatorWeight(processor.apply(parsed))
+
+            # при равных весах выше стоит более раннее предложение, как при устойчивой сортировке
+            item = (weight, -index, sentence)
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+        return [(sentence, weight, -index) for weight, index, sentence in sorted(heap, reverse=True)]
+
+    def summarize_file(self, file_name, indicators = True, adj = False, percentage = 10):
+        """
+        Потоковый аналог selectFinalSents(SUMMARIZER.rank(...), percentage):
+        предложения реферата в порядке следования в тексте.
+        """
+        return sorted(self.rank(file_name, indicators, adj, percentage), key=lambda w: w[2])
+
+    def summarize(self, file_name, output_name, indicators = True, adj = False, percentage = 10):
+        res = []
+        try:
+            res = self.summarize_file(file_name, indicators, adj, percentage)
+        except SummarizationError as error:
+            print(error)
+        with open(output_name, 'w', encoding=self.encoding) as output_file:
+            for sentence, _, _ in res:
+                output_file.write(sentence + '\n')
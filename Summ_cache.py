@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import regex as re
+
+from Templates import template_registry, template_set_name
+
+# нормализация текста для ключа кэша
+def normalize_text(raw_text):
+    """
+    Приводит текст к виду, не зависящему от пробельных различий,
+    которые не меняют результат реферирования: пробелы внутри строки
+    схлопываются, пустые строки (лишние переводы строк между
+    абзацами) отбрасываются. Деление на абзацы сохраняется,
+    так как от него зависят веса терминов.
+    """
+    lines = (' '.join(line.split()) for line in re.split(r"[\r\n]+", raw_text))
+    return '\n'.join(line for line in lines if line)
+
+# кэш ранжированных списков предложений
+class SummaryCache():
+    """
+    Кэш результатов SUMMARIZER.rank(). Ключ - хэш нормализованного
+    текста и параметров, от которых зависит ранжирование: indicators,
+    adj, способ подсчета весов, версия набора шаблонов (хэш файлов
+    шаблонов), индекс idf и окно подсчета связей, если они используются.
+    Процент сжатия в ключ не входит: хранится весь
+    ранжированный список [(sentence, weight, index), ...] вместе
+    с найденными аспектами, и любая выборка строится из него через
+    selectFinalSents() без пересчета весов.
+
+    Первый уровень - LRU в памяти на maxsize записей. Второй уровень
+    (если задан path) - база SQLite, ограниченная max_bytes: при
+    превышении удаляются давно не использовавшиеся записи. База
+    открывается отдельно в каждом процессе, поэтому один файл могут
+    использовать несколько рабочих процессов.
+    """
+    version = 1
+
+    def __init__(self, maxsize = 1024, path = None, max_bytes = 256 * 2**20):
+        self.maxsize = maxsize
+        self.path = path
+        self.max_bytes = max_bytes
+        self.records = OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, raw_text, indicators = True, adj = False, engine = 'python', idf = None, window = None):
+        sha = hashlib.sha256()
+        templates = template_registry.digest(template_set_name(adj)) if indicators else ''
+        idf_digest = idf.digest if idf is not None else ''
+        sha.update(f"{self.version}|{int(indicators)}|{int(adj)}|{engine}|{templates}|{idf_digest}|".encode())
+        if window is not None:
+            # окно (размер, единица) меняет веса; ключи точного режима остаются прежними
+            sha.update("window:{}:{}|".format(*window).encode())
+        sha.update(normalize_text(raw_text).encode('utf-8'))
+        return sha.hexdigest()
+
+    def database(self):
+        if self.connection is None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS summaries "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS summaries_used ON summaries (used)")
+            self.connection.commit()
+            self.pid = os.getpid()
+        return self.connection
+
+    def remember(self, key, entry):
+        self.records[key] = entry
+        self.records.move_to_end(key)
+        if len(self.records) > self.maxsize:
+            self.records.popitem(last=False)
+
+    def get(self, key):
+        """
+        Возвращает пару (ранжированный список, {номер: аспекты})
+        или None, если записи нет ни на одном уровне.
+        """
+        with self.lock:
+            entry = self.records.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.records.move_to_end(key)
+                return entry
+            if self.path is not None:
+                connection = self.database()
+                row = connection.execute("SELECT value FROM summaries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    connection.execute("UPDATE summaries SET used = ? WHERE key = ?", (time.time(), key))
+                    connection.commit()
+                    entry = pickle.loads(row[0])
+                    self.disk_hits += 1
+                    self.remember(key, entry)
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, key, ranked, aspect_hits = None):
+        entry = (tuple(ranked), dict(aspect_hits or {}))
+        with self.lock:
+            self.remember(key, entry)
+            if self.path is not None:
+                value = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+                connection = self.database()
+                connection.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+                                   (key, value, len(value), time.time()))
+                self.evict(connection)
+                connection.commit()
+        return entry
+
+    def evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = connection.execute("SELECT key, size FROM summaries ORDER BY used").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM summaries WHERE key = ?", stale)
+
+    def hit_rate(self):
+        total = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / total if total else 0.0
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+            if self.path is not None:
+                connection = self.database()
+                connection.execute("DELETE FROM summaries")
+                connection.commit()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def close(self):
+        if self.connection is not None and self.pid == os.getpid():
+            self.connection.close()
+        self.connection = None
+
+# кэш коэффициентов индикаторов по предложениям
+class IndicatorCache():
+    """
+    Кэш результатов шаблонов аспектов для отдельных предложений: пара
+    (коэффициент индикаторов, кортеж аспектов) (см. countIndicatorChunk()).
+    Повторяющиеся в корпусе предложения (стандартные формулировки,
+    дисклеймеры, подписи) не разбираются и не проверяются шаблонами
+    повторно. Ключ - хэш предложения со схлопнутыми пробелами, версии
+    набора шаблонов и токенизатора, которым предложение разбито на слова.
+
+    Первый уровень - LRU в памяти на maxsize записей. Второй уровень
+    (если задан path) - база SQLite, общая для рабочих процессов.
+    Хранилище в основном читается: записи текста ищутся одним запросом,
+    новые добавляются одной транзакцией, время использования при чтении
+    не обновляется; при превышении max_entries удаляются самые старые записи.
+    """
+    version = 1
+
+    def __init__(self, maxsize = 65536, path = None, max_entries = 2**20):
+        self.maxsize = maxsize
+        self.path = path
+        self.max_entries = max_entries
+        self.records = OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+        self.prefixes = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, sentence, adj = False, tokenizer = 'nltk'):
+        prefix = self.prefixes.get((adj, tokenizer))
+        if prefix is None:
+            templates = template_registry.digest(template_set_name(adj))
+            prefix = self.prefixes[(adj, tokenizer)] = f"{self.version}|{templates}|{tokenizer}|".encode()
+        return hashlib.sha256(prefix + ' '.join(sentence.split()).encode('utf-8')).hexdigest()
+
+    def database(self):
+        if self.connection is None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS indicators "
+                "(id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, weight REAL NOT NULL, hits TEXT NOT NULL)")
+            self.connection.commit()
+            self.pid = os.getpid()
+        return self.connection
+
+    def remember(self, key, entry):
+        self.records[key] = entry
+        self.records.move_to_end(key)
+        if len(self.records) > self.maxsize:
+            self.records.popitem(last=False)
+
+    def get_many(self, keys):
+        """
+        Возвращает список записей (коэффициент, аспекты) в порядке keys;
+        для ключей, которых нет ни на одном уровне, - None.
+        """
+        with self.lock:
+            result = [self.records.get(key) for key in keys]
+            missing = [key for key, entry in zip(keys, result) if entry is None]
+            found = {}
+            if missing and self.path is not None:
+                connection = self.database()
+                unique = list(dict.fromkeys(missing))
+                for start in range(0, len(unique), 500):
+                    part = unique[start:start + 500]
+                    rows = connection.execute(
+                        f"SELECT key, weight, hits FROM indicators WHERE key IN ({','.join('?' * len(part))})",
+                        part).fetchall()
+                    for key, weight, hits in rows:
+                        found[key] = (weight, tuple(hits.split()))
+            for position, key in enumerate(keys):
+                if result[position] is not None:
+                    self.hits += 1
+                    self.records.move_to_end(key)
+                elif key in found:
+                    self.disk_hits += 1
+                    result[position] = found[key]
+                    self.remember(key, found[key])
+                else:
+                    self.misses += 1
+            return result
+
+    def put_many(self, items):
+        """
+        Сохраняет пары (ключ, (коэффициент, аспекты)).
+        """
+        with self.lock:
+            for key, entry in items:
+                self.remember(key, entry)
+            if self.path is not None and items:
+                connection = self.database()
+                connection.executemany("INSERT OR IGNORE INTO indicators (key, weight, hits) VALUES (?, ?, ?)",
+                                       [(key, weight, ' '.join(hits)) for key, (weight, hits) in items])
+                self.evict(connection)
+                connection.commit()
+
+    def evict(self, connection):
+        last = connection.execute("SELECT COALESCE(MAX(id), 0) FROM indicators").fetchone()[0]
+        if last > self.max_entries:
+            connection.execute("DELETE FROM indicators WHERE id <= ?", (last - self.max_entries,))
+
+    def hit_rate(self):
+        total = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / total if total else 0.0
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+            if self.path is not None:
+                connection = self.database()
+                connection.execute("DELETE FROM indicators")
+                connection.commit()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def close(self):
+        if self.connection is not None and self.pid == os.getpid():
+            self.connection.close()
+        self.connection = None
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+from collections import Counter
+from contextlib import nullcontext
+import json
+import logging
+import time
+
+from Morph_cache import morph_cache
+
+# замер одного этапа
+class StageTimer():
+    __slots__ = ('metrics', 'name', 'wall', 'cpu')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record_stage(self.name,
+            time.perf_counter() - self.wall, time.process_time() - self.cpu)
+        return False
+
+# сбор метрик суммаризатора
+class Metrics():
+    """
+    Метрики работы SUMMARIZER: стенное и процессорное время этапов,
+    счетчики (абзацы, предложения, токены, стемы), совпадения шаблонов
+    по аспектам и попадания в кэш морфологии. Метрики накапливаются
+    по всем документам; после каждого документа его собственная
+    запись передается в callback (если задан), например для вывода
+    в структурированный лог (см. log_callback()). Накопленные значения
+    выгружаются в текстовом формате Prometheus (to_prometheus()).
+    """
+    enabled = True
+
+    def __init__(self, callback = None):
+        self.callback = callback
+        self.stage_wall = Counter()
+        self.stage_cpu = Counter()
+        self.stage_calls = Counter()
+        self.counters = Counter()
+        self.aspect_matches = Counter()
+        self.documents = Counter()
+        self.morph_hits = 0
+        self.morph_misses = 0
+        self.document = None
+
+    def start_document(self):
+        self.document = {'stages' : {}, 'counters' : Counter(), 'aspect_matches' : Counter()}
+        self.cache_start = (morph_cache.hits, morph_cache.misses)
+
+    def stage(self, name):
+        return StageTimer(self, name)
+
+    def record_stage(self, name, wall, cpu):
+        self.stage_wall[name] += wall
+        self.stage_cpu[name] += cpu
+        self.stage_calls[name] += 1
+        if self.document is not None:
+            self.document['stages'][name] = {'wall' : wall, 'cpu' : cpu}
+
+    def count(self, name, value = 1):
+        self.counters[name] += value
+        if self.document is not None:
+            self.document['counters'][name] += value
+
+    def count_aspect(self, aspect):
+        self.aspect_matches[aspect] += 1
+        if self.document is not None:
+            self.document['aspect_matches'][aspect] += 1
+
+    def end_document(self, status = 'ok'):
+        hits = morph_cache.hits - self.cache_start[0]
+        misses = morph_cache.misses - self.cache_start[1]
+        self.morph_hits += hits
+        self.morph_misses += misses
+        self.documents[status] += 1
+        record = self.document
+        self.document = None
+        record['status'] = status
+        record['morph_cache'] = {
+            'hits' : hits,
+            'misses' : misses,
+            'hit_rate' : hits / (hits + misses) if hits + misses else 0.0,
+        }
+        if self.callback is not None:
+            self.callback(record)
+        return record
+
+    def to_prometheus(self, prefix = 'summarizer'):
+        lines = [
+            f"# HELP {prefix}_documents_total Documents processed by status.",
+            f"# TYPE {prefix}_documents_total counter",
+        ]
+        lines += [f'{prefix}_documents_total{{status="{status}"}} {value}'
+                  for status, value in sorted(self.documents.items())]
+        lines += [
+            f"# HELP {prefix}_stage_seconds_total Time spent in pipeline stages.",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+        ]
+        for name in sorted(self.stage_calls):
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{name}",clock="wall"}} {self.stage_wall[name]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{name}",clock="cpu"}} {self.stage_cpu[name]:.6f}')
+        lines += [
+            f"# HELP {prefix}_stage_calls_total Pipeline stage executions.",
+            f"# TYPE {prefix}_stage_calls_total counter",
+        ]
+        lines += [f'{prefix}_stage_calls_total{{stage="{name}"}} {value}'
+                  for name, value in sorted(self.stage_calls.items())]
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        lines += [
+            f"# HELP {prefix}_template_matches_total Sentences matched by aspect templates.",
+            f"# TYPE {prefix}_template_matches_total counter",
+        ]
+        lines += [f'{prefix}_template_matches_total{{aspect="{aspect}"}} {value}'
+                  for aspect, value in sorted(self.aspect_matches.items())]
+        lines += [
+            f"# TYPE {prefix}_morph_cache_hits_total counter",
+            f"{prefix}_morph_cache_hits_total {self.morph_hits}",
+            f"# TYPE {prefix}_morph_cache_misses_total counter",
+            f"{prefix}_morph_cache_misses_total {self.morph_misses}",
+        ]
+        return '\n'.join(lines) + '\n'
+
+# отключенные метрики: все вызовы ничего не делают
+class NullMetrics():
+    enabled = False
+    _stage = nullcontext()
+
+    def start_document(self):
+        pass
+
+    def stage(self, name):
+        return self._stage
+
+    def count(self, name, value = 1):
+        pass
+
+    def count_aspect(self, aspect):
+        pass
+
+    def end_document(self, status = 'ok'):
+        pass
+
+NULL_METRICS = NullMetrics()
+
+# callback, пишущий запись документа в лог одной строкой JSON
+def log_callback(logger, level = logging.INFO):
+    def callback(record):
+        logger.log(level, json.dumps(record, ensure_ascii=False))
+    return callback
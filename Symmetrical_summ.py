@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import math
 import regex as re
+from collections import Counter
 
 # пересчет весов для предложений
 class SymmetricalSummarizationWeightCount():
@@ -8,77 +9,196 @@ class SymmetricalSummarizationWeightCount():
     Проводится начисление весов предложениям по методике симметричного реферирования
     (Яцко В.А. Симметричное реферирование: теоретические основы и методика
      // Научно-техническая информация. Сер.2. - 2002. -  № 5).
+
+    Если задано окно window, связи считаются только между предложениями,
+    отстоящими друг от друга не больше чем на window предложений
+    (window_unit = 'sentences') или абзацев (window_unit = 'paragraphs'):
+    связи с далекими предложениями длинного документа не учитываются.
+    Это не ускорение: точный подсчет по гистограммам частот (countLinks())
+    тоже линеен по числу вхождений терминов и обычно не медленнее окна.
+    По умолчанию (window = None) связи считаются между всеми
+    предложениями текста.
     """
+    f_digits = re.compile(r"[0-9]+([\.\,\:][0-9]+)*")
+    window_units = ('sentences', 'paragraphs')
+
+    def __init__(self, window = None, window_unit = 'sentences'):
+        if window is not None and window < 0:
+            raise ValueError("window must be a non-negative number of sentences or paragraphs")
+        if window_unit not in self.window_units:
+            raise ValueError(f"Unknown window unit: {window_unit}")
+        self.window = window
+        self.window_unit = window_unit
+
+    def windowUnits(self, sents_with_termsfreqs, paragraphs = None):
+        """
+        Метод возвращает для каждого предложения номер единицы, по которой
+        отсчитывается окно: номер предложения или номер абзаца.
+        paragraphs - список количеств предложений в абзацах.
+        """
+        if self.window_unit == 'sentences':
+            return range(len(sents_with_termsfreqs))
+        if paragraphs is None:
+            raise ValueError("Paragraph window needs the number of sentences in each paragraph")
+        return [number for number, size in enumerate(paragraphs) for _ in range(size)]
+
+    def buildTermIndex(self, sents_with_termsfreqs):
+        """
+        Метод строит инвертированный индекс по списку предложений-словарей.
+        Каждому термину ставится в соответствие список пар
+        (позиция предложения, частота термина в предложении),
+        упорядоченный по позиции предложения в тексте.
+        Возвращается словарь {термин: [(позиция, частота), ...]}
+        """
+        index = {}
+        for position, sentence in enumerate(sents_with_termsfreqs):
+            for word, count in sentence.items():
+                index.setdefault(word, []).append((position, count))
+        return index
 
-    def rightLinksCount(self, tfidf_terms, sents_with_termsfreqs):
+    def countLinks(self, sents_with_termsfreqs, paragraphs = None):
+        """
+        Метод за один проход по инвертированному индексу вычисляет
+        контекстные веса связей каждого предложения влево и вправо.
+        Для термина, встретившегося в предложении с частотой c,
+        вклад связи с другим предложением равен max(c, c'), где c' -
+        частота термина в другом предложении. Сумма таких вкладов
+        по предшествующим предложениям считается по префиксной
+        гистограмме частот термина, а по последующим - как разность
+        суммы по всем предложениям и суммы по предшествующим.
+        Возвращается пара списков (веса связей влево, веса связей вправо).
+        Если задано окно, связи считаются в countWindowLinks().
+        """
+        if self.window is not None:
+            return self.countWindowLinks(sents_with_termsfreqs,
+                                         self.windowUnits(sents_with_termsfreqs, paragraphs))
+        left_links = [0] * len(sents_with_termsfreqs)
+        right_links = [0] * len(sents_with_termsfreqs)
+        for postings in self.buildTermIndex(sents_with_termsfreqs).values():
+            if len(postings) < 2:
+                continue
+            # гистограмма частот термина по всему тексту и по уже пройденным предложениям
+            total = Counter(count for _, count in postings)
+            prefix = Counter()
+            for position, count in postings:
+                left = sum(max(count, value) * number for value, number in prefix.items())
+                # вклад самого предложения (max(count, count) = count) исключается
+                others = sum(max(count, value) * number for value, number in total.items()) - count
+                left_links[position] += left
+                right_links[position] += others - left
+                prefix[count] += 1
+        return left_links, right_links
+
+    def countWindowLinks(self, sents_with_termsfreqs, units):
+        """
+        Метод считает веса связей так же, как countLinks(), но только
+        с предложениями, номер единицы которых (units, см. windowUnits())
+        отличается не больше чем на window. Для каждого термина по его
+        списку вхождений сдвигаются два окна - предшествующих и последующих
+        предложений - с гистограммами частот термина в них, поэтому каждое
+        вхождение добавляется в окно и удаляется из него один раз; частоты,
+        которых в окне больше нет, удаляются из гистограммы.
+        """
+        window = self.window
+        left_links = [0] * len(sents_with_termsfreqs)
+        right_links = [0] * len(sents_with_termsfreqs)
+        for postings in self.buildTermIndex(sents_with_termsfreqs).values():
+            if len(postings) < 2:
+                continue
+            # окно слева - вхождения postings[low:i], справа - postings[i+1:high]
+            left = Counter()
+            right = Counter()
+            low = high = 0
+            for i, (position, count) in enumerate(postings):
+                unit = units[position]
+                while high < len(postings) and units[postings[high][0]] <= unit + window:
+                    right[postings[high][1]] += 1
+                    high += 1
+                right[count] -= 1
+                if not right[count]:
+                    del right[count]
+                while units[postings[low][0]] < unit - window:
+                    value = postings[low][1]
+                    left[value] -= 1
+                    if not left[value]:
+                        del left[value]
+                    low += 1
+                left_links[position] += sum(max(count, value) * number for value, number in left.items())
+                right_links[position] += sum(max(count, value) * number for value, number in right.items())
+                left[count] += 1
+        return left_links, right_links
+
+    def countOwnWeights(self, tfidf_terms, sents_with_termsfreqs):
+        """
+        Метод суммирует для каждого предложения веса входящих
+        в него ключевых слов с учетом их частоты в предложении.
+        """
+        tf_dict = dict(tfidf_terms)
+        return [
+            sum(tf_dict.get(word, 0)*count for word, count in sentence.items())
+            for sentence in sents_with_termsfreqs ]
+
+    def rightLinksCount(self, tfidf_terms, sents_with_termsfreqs, paragraphs = None):
         """
         Метод производит поиск связей между предложениями вправо.
         Принимает на вход список tf-idf, и список словарей с частотами
         для каждого предложения. Берется предложение (словарь), если в нем есть
-        термин из tf-idf, то ищется вхождение этого термина в предложениях справа.
+        термин, то ищется вхождение этого термина в предложениях справа.
         Если термин встретился в предложении справа, то выбирается его наибольшая
         частота (т.е. либо из исходного предложения, либо из правого), эта
         частота суммируется с общим весом предложения. Последнее предложение
-        скидывается в список с нулевым весом, т.к. справа от него ничего нет.
+        получает нулевой вес связей, т.к. справа от него ничего нет.
         Возвращается список кортежей, в котором предложениям (словараям)
         приписаны веса [({sentence1}, вес), ({sentence2}, вес)]
         Параллельно для текущего предложения суммируются веса входящих
         в него ключевых слов, сумма прибавляется к весу предложения.
         Дополнительно вычисляется позиционный коэффициент, т.е. чем выше
         предложение, тем больше вес. Тоже прибавляется к общему весу.
+        Связи считаются по инвертированному индексу (см. countLinks());
+        paragraphs (количества предложений в абзацах) нужны только для окна в абзацах.
         """
-        tf_dict = dict(tfidf_terms)
-        w_sent = []
-        for line, left in enumerate(sents_with_termsfreqs):
-            pscore = 10 / (line+1)
-            right_context = sents_with_termsfreqs[line+1:] + [dict()]
-            own_weight = sum(tf_dict.get(word, 0)*count for word, count in left.items())
-            context_weight = sum(
-                max(value, right[word])
-                for word, value in left.items()
-                for right in right_context
-                if word in right
-            )
-            w_sent.append((left, own_weight + context_weight + pscore))     
-        return w_sent
+        _, right_links = self.countLinks(sents_with_termsfreqs, paragraphs)
+        own_weights = self.countOwnWeights(tfidf_terms, sents_with_termsfreqs)
+        return [
+            (sentence, own_weight + context_weight + 10 / (line+1))
+            for line, (sentence, own_weight, context_weight)
+            in enumerate(zip(sents_with_termsfreqs, own_weights, right_links)) ]
 
-    def leftLinksCount(self, tfidf_terms, sents_with_termsfreqs):
+    def leftLinksCount(self, tfidf_terms, sents_with_termsfreqs, paragraphs = None):
         """
         Метод производит поиск связей между предложениями влево.
-        Тот же алгоритм, что и при поиске вправо, только с нулевым
-        весом скидывается первое предложение. Чтобы реализовать
-        поиск влево, список предложений переворачивается.
+        Тот же алгоритм, что и при поиске вправо, только нулевой
+        вес связей получает первое предложение.
         Возвращается список кортежей, в котором предложениям (словараям)
         приписаны веса [({sentence1}, вес), ({sentence2}, вес)]
+        paragraphs - как в rightLinksCount().
         """
-        tf_dict = dict(tfidf_terms)
-        w_sent = []
-        for line, right in enumerate(sents_with_termsfreqs):
-            pscore = 10 / (line+1)
-            left_context = [dict()] + sents_with_termsfreqs[:line]
-            own_weight = sum(tf_dict.get(word, 0)*count for word, count in right.items())
-            context_weight = sum(
-                max(value, left[word])
-                for word, value in right.items()
-                for left in left_context
-                if word in left
-            )
-            w_sent.append((right, own_weight + context_weight + pscore))
-        return w_sent
+        left_links, _ = self.countLinks(sents_with_termsfreqs, paragraphs)
+        own_weights = self.countOwnWeights(tfidf_terms, sents_with_termsfreqs)
+        return [
+            (sentence, own_weight + context_weight + 10 / (line+1))
+            for line, (sentence, own_weight, context_weight)
+            in enumerate(zip(sents_with_termsfreqs, own_weights, left_links)) ]
 
-    def countSymmetry(self, tfidf_terms, sents_with_termsfreqs):
+    def countSymmetry(self, tfidf_terms, sents_with_termsfreqs, paragraphs = None):
         """
-        Метод складывает два списка, полученных при поиске
+        Метод складывает веса, полученные при поиске
         вправо и влево. Принимает на вход так же список tf-idf,
-        и список предложений-словарей. Внутри явно вызываются
-        функции установления правых и левых связей, порядок
-        предложений в двух списках выравнивается и их веса складываются.
+        и список предложений-словарей. Связи в обе стороны
+        вычисляются за один проход по инвертированному индексу,
+        веса предложений складываются. paragraphs (количества предложений
+        в абзацах) нужны только для окна в абзацах.
         Возвращается список кортежей предложений-словарей с весами.
         """
-        return [(left[0], left[1] + right[1])
-            for left, right in zip(
-            self.leftLinksCount(tfidf_terms, sents_with_termsfreqs),
-            self.rightLinksCount(tfidf_terms, sents_with_termsfreqs)) ]
+        left_links, right_links = self.countLinks(sents_with_termsfreqs, paragraphs)
+        own_weights = self.countOwnWeights(tfidf_terms, sents_with_termsfreqs)
+        result = []
+        for line, sentence in enumerate(sents_with_termsfreqs):
+            pscore = 10 / (line+1)
+            result.append((sentence,
+                (own_weights[line] + left_links[line] + pscore)
+                + (own_weights[line] + right_links[line] + pscore)))
+        return result
 
     def countFinalSymmetryWeight(
         self,
@@ -87,6 +207,7 @@ class SymmetricalSummarizationWeightCount():
         total_stems_in_text,
         total_sents_in_text,
         stemmed_pnn,
+        paragraphs = None,
     ):
         """
         Метод добавляет к весам предложения дополнительный
@@ -98,34 +219,31 @@ class SymmetricalSummarizationWeightCount():
         весу каждого предложения добавляется доп. коэффициент.
         Также каждый вес умножается на кол-во имен собственных и цифр.
         """
-        w_sent1 = self.countSymmetry(tfidf_terms, sents_with_termsfreqs)
+        w_sent1 = self.countSymmetry(tfidf_terms, sents_with_termsfreqs, paragraphs)
         
         # average sentence length
         asl = total_stems_in_text / total_sents_in_text
         
-        # список для хранения частот "имен собственных" в каждом предложении
-        proper_counts = [
-            sum(pnn in sentence for pnn in stemmed_pnn)
+        return [
+            (sentence, self.adjustSentenceWeight(sentence, weight, asl, stemmed_pnn))
             for sentence, weight in w_sent1 ]
-        w_sent2 = [
-            (sentence, weight * (1 + math.log(proper, 2) if proper else 1))
-            for (sentence, weight), proper in zip(w_sent1, proper_counts) ]
-        
-        f_digits = re.compile(r"[0-9]+([\.\,\:][0-9]+)*")
-        digits = [
-            sum([bool(re.fullmatch(f_digits, word)) * value
-                for word, value in sentence.items()])
-            for sentence, weight in w_sent2 ]
-        
-        w_sent3 = [
-            (sentence, weight * (1 + math.log(dg, 2) if dg else 1))
-            for (sentence, weight), dg in zip(w_sent2, digits) ]
+
+    def adjustSentenceWeight(self, sentence, weight, asl, stemmed_pnn):
+        """
+        Метод применяет к весу одного предложения-словаря коэффициенты
+        countFinalSymmetryWeight(): вес умножается на коэффициенты
+        количества "имен собственных" и цифр, затем для длинных
+        предложений применяется поправка ASL.
+        """
+        # частота "имен собственных" в предложении
+        proper = sum(word in stemmed_pnn for word in sentence)
+        weight = weight * (1 + math.log(proper, 2) if proper else 1)
         
-        w_sent4 = [
-            (sentence, (asl * weight) / len(sentence) if len(sentence) > 5 else weight)
-            for (sentence, weight), dg in zip(w_sent3, digits) ]
+        digits = sum([bool(re.fullmatch(self.f_digits, word)) * value
+            for word, value in sentence.items()])
+        weight = weight * (1 + math.log(digits, 2) if digits else 1)
         
-        return w_sent4
+        return (asl * weight) / len(sentence) if len(sentence) > 5 else weight
 
     def convertSymmetryToOrdinary(self, symm_weights, ordinary_sents):
         """
@@ -1,73 +1,617 @@
 # -*- coding: utf-8 -*-
 
-from nltk.tokenize import sent_tokenize, word_tokenize
-from pymorphy2 import MorphAnalyzer
+import hashlib
+import os
+import pickle
 import re
+import time
+
+import regex
+
+from Morph_cache import Translator, morph_cache
+from Resources import resources
+from Text_terms import analyze_sentence
+
+
+ASPECTS = ["Aim", "Method", "Problem", "Relevance", "Result"]
+
+# наборы шаблонов: каталог и маска имени файла для аспекта
+TEMPLATE_SETS = {
+    'templates_1' : "{}_all_patterns",
+    'templates_2' : "{}_all_patterns_a",
+}
 
 
 class TextProcessor():
-    def __init__(self, flag = False):
-        self.aspects = ["Aim", "Method", "Problem", "Relevance", "Result"]
-        self.templates = {}
-        for aspect in self.aspects:
-            if not flag:
-                self.make_dict(f"./templates_1/{aspect.lower()}_all_patterns", aspect) 
-            else:
-                self.make_dict(f"./templates_2/{aspect.lower()}_all_patterns_a", aspect)            
-        self.morph = MorphAnalyzer()
-        self.translator = Translator()
-    
-    def make_dict(self, file_name, aspect):
-        with open(file_name, 'r') as file:
-            self.templates[aspect] = Template(file.readlines(), aspect)        
+    """
+    time_budget - время в секундах на сопоставление одного предложения
+    со всеми шаблонами; по умолчанию (None) время не ограничено. Если оно
+    исчерпано, используются совпадения, найденные до этого момента, а оставшиеся
+    аспекты считаются не найденными; такие предложения считаются в timeouts.
+    Результат с ограничением зависит от скорости и загрузки машины, поэтому
+    оно включается явно (в командных утилитах и сервисе).
+    """
+    # режимы apply(): метод шаблона для каждого режима
+    modes = {'all' : 'analyze', 'best' : 'best', 'presence' : 'present'}
+
+    def __init__(self, flag = False, time_budget = None):
+        self.aspects = ASPECTS
+        self.templates = template_registry.get(template_set_name(flag))
+        self.scanner = template_registry.scanner(template_set_name(flag))
+        self.morph_cache = morph_cache
+        self.time_budget = time_budget
+        self.timeouts = 0
     
     def parse(self, text):
-        words = map(word_tokenize, text)
-        for sentence in words:
-            result = []
-            for w in sentence:
-                parsed = self.morph.parse(self.morph.parse(w)[0].normal_form)[0]
-                pos, norm = self.translator.apply(parsed)
-                if pos:
-                    result.append((pos, norm))
-            yield ' '.join(sentence), ''.join([f"{pos}<{norm}>" for pos, norm in result])
+        return self.parse_tokens(map(analyze_sentence, text))
+
+    def parse_tokens(self, token_sents):
+        """
+        Принимает предложения в виде списков записей Token
+        (см. Text_terms.analyze_sentence) и строит для каждого
+        строку вида POS<лемма> для сопоставления с шаблонами.
+        """
+        for tokens in token_sents:
+            yield ' '.join([token.word for token in tokens]), self.tag(tokens)
+
+    @staticmethod
+    def tag(tokens):
+        # строка POS<лемма> для сопоставления с шаблонами
+        return ''.join([f"{token.pos}<{token.lemma}>" for token in tokens if token.pos])
     
-    def apply(self, sentence):
-        extracted_aspects = [self.templates[aspect].analyze(sentence) for aspect in self.aspects]
+    def apply(self, sentence, mode = 'all'):
+        """
+        Регулярное выражение аспекта запускается только для предложений,
+        в которых найден хотя бы один обязательный литерал его шаблонов
+        (см. LiteralScanner), для остальных результат заранее пуст.
+        Разбиение предложения на токены (TokenSequence) общее для всех аспектов.
+        mode - что возвращается для каждого аспекта: 'all' - все совпадения
+        (Template.analyze()), 'best' - только лучшее (Template.best()),
+        'presence' - True/False без разбора групп (Template.present()).
+        """
+        if mode not in self.modes:
+            raise ValueError(f"Unknown mode: {mode}")
+        if mode == 'presence':
+            empty = lambda: False
+        else:
+            empty = list
+        candidates = self.scanner.scan(sentence)
+        if not candidates:
+            return [empty() for aspect in self.aspects]
+        sequence = TokenSequence(sentence)
+        deadline = time.perf_counter() + self.time_budget if self.time_budget is not None else None
+        method = self.modes[mode]
+        extracted_aspects = []
+        for aspect in self.aspects:
+            if aspect not in candidates:
+                extracted_aspects.append(empty())
+                continue
+            try:
+                extracted_aspects.append(getattr(self.templates[aspect], method)(sentence, sequence, deadline))
+            except TimeBudgetExceeded as error:
+                extracted_aspects.append(error.args[0])
+                self.timeouts += 1
+                extracted_aspects.extend(empty() for _ in self.aspects[len(extracted_aspects):])
+                break
         return extracted_aspects
 
-class Translator():
-    def __init__(self):
-        self.pm2lspl_pos = {
-            'NOUN' : 'N',   #существительное
-            'ADJF' : 'A',   #прилагательное(полное)
-            'ADJS' : 'A',   #прилагательное(краткое)
-            'COMP' : 'A',   #компаратив
-            'VERB' : 'V',   #глагол(личная', #форма)
-            'INFN' : 'V',   #глагол(инфинитив)
-            'PRTF' : 'Pa',  #причастие(полное)
-            'PRTS' : 'Pa',  #причастие(краткое)
-            'GRND' : 'Ap',  #деепричастие
-            'NUMR' : 'Num', #числительное
-            'ADVB' : 'Av',  #наречие
-            'NPRO' : 'Pn',  #местоимение
-            'PRED' : 'Av',  #предикатив
-            'PREP' : 'Pr',  #предлог
-            'CONJ' : 'Cn',  #союз
-            'PRCL' : 'Pt',  #частица
-            'INTJ' : 'Int', #междометие
+# имя набора шаблонов по флагу adj
+def template_set_name(flag = False):
+    return 'templates_2' if flag else 'templates_1'
+
+# реестр скомпилированных шаблонов
+class TemplateRegistry():
+    """
+    Реестр шаблонов, общий для процесса: каждый набор шаблонов
+    (templates_1 / templates_2) разбирается и компилируется один раз.
+    Раскрытые определения шаблонов (Template.dct, Template.dct_len)
+    сохраняются в файл кэша рядом с шаблонами. Файл кэша привязан
+    к хэшу содержимого файлов шаблонов, поэтому при изменении
+    любого из них кэш перестраивается автоматически.
+    """
+    cache_version = 2
+    cache_name = 'compiled_cache.pickle'
+
+    def __init__(self, base_dir = os.path.dirname(os.path.abspath(__file__))):
+        self.base_dir = base_dir
+        self.sets = {}
+        self.scanners = {}
+        self.digests = {}
+
+    def files(self, name):
+        mask = TEMPLATE_SETS[name]
+        return {aspect : os.path.join(self.base_dir, name, mask.format(aspect.lower()))
+                for aspect in ASPECTS}
+
+    def digest(self, name):
+        if name not in self.digests:
+            sha = hashlib.sha256()
+            for aspect, file_name in self.files(name).items():
+                with open(file_name, 'rb') as file:
+                    sha.update(aspect.encode())
+                    sha.update(file.read())
+            self.digests[name] = sha.hexdigest()
+        return self.digests[name]
+
+    def get(self, name):
+        if name not in self.sets:
+            self.sets[name] = self.load(name)
+        return self.sets[name]
+
+    def scanner(self, name):
+        if name not in self.scanners:
+            self.scanners[name] = LiteralScanner(self.get(name))
+        return self.scanners[name]
+
+    def load(self, name):
+        digest = self.digest(name)
+        cache_path = os.path.join(self.base_dir, name, self.cache_name)
+        try:
+            with open(cache_path, 'rb') as file:
+                cached = pickle.load(file)
+            if cached['version'] == self.cache_version and cached['digest'] == digest:
+                return {aspect : Template.from_compiled(aspect, *compiled)
+                        for aspect, compiled in cached['templates'].items()}
+        except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+            pass
+
+        templates = {}
+        for aspect, file_name in self.files(name).items():
+            with open(file_name, 'r', encoding='cp1251') as file:
+                templates[aspect] = Template(file.readlines(), aspect)
+        self.save(cache_path, digest, templates)
+        return templates
+
+    def save(self, cache_path, digest, templates):
+        cached = {
+            'version' : self.cache_version,
+            'digest' : digest,
+            'templates' : {aspect : template.compiled() for aspect, template in templates.items()},
         }
-    
-    def apply(self, parsed):
-        pos = parsed.tag.POS
-        return (None, parsed.normal_form) \
-          if pos is None \
-          else (self.pm2lspl_pos[pos], parsed.normal_form)
+        tmp_path = f"{cache_path}.tmp{os.getpid()}"
+        try:
+            with open(tmp_path, 'wb') as file:
+                pickle.dump(cached, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # каталог шаблонов может быть недоступен для записи - работаем без кэша
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+# поиск обязательных литералов шаблонов
+class LiteralScanner():
+    """
+    Автомат Ахо-Корасик по обязательным литералам шаблонов аспектов
+    (см. Template.required). За один проход по строке предложения вида
+    POS<лемма> находит аспекты, регулярные выражения которых могут
+    дать совпадение. Аспекты, для которых обязательные литералы
+    вывести не удалось, считаются возможными всегда.
+    """
+    def __init__(self, templates):
+        self.unfiltered = frozenset(aspect for aspect, template in templates.items()
+                                    if template.required is None)
+        self.total = len(templates)
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [frozenset()]
+        for aspect, template in templates.items():
+            for literal in template.required or ():
+                self.add(literal, aspect)
+        self.link()
+
+    def add(self, literal, aspect):
+        state = 0
+        for char in literal:
+            if char not in self.goto[state]:
+                self.goto[state][char] = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(frozenset())
+            state = self.goto[state][char]
+        self.output[state] |= {aspect}
+
+    def link(self):
+        # ссылки неудачи строятся обходом бора в ширину
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] |= self.output[self.fail[next_state]]
+
+    def scan(self, text):
+        found = set(self.unfiltered)
+        if len(found) == self.total:
+            return found
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+                if len(found) == self.total:
+                    break
+        return found
+
+# недоступная разбору часть регулярного выражения шаблона
+class UnsupportedPattern(ValueError):
+    pass
+
+# время на сопоставление предложения с шаблонами исчерпано;
+# args[0] - совпадения, найденные до этого момента
+class TimeBudgetExceeded(Exception):
+    pass
+
+# токены строки предложения POS<лемма>
+class TokenSequence():
+    """
+    Строка предложения вида POS<лемма>POS<лемма>..., разбитая на токены.
+    exact ложно, если строку нельзя однозначно разбить на токены
+    (лемма с угловыми скобками и т.п.) - тогда используется
+    регулярное выражение.
+    """
+    __slots__ = ('text', 'strings', 'tokens', 'words', 'tags', 'exact')
+
+    token = re.compile(r"([^<>]*)<([^<>]*)>")
+    word = re.compile(r"\w*")
+
+    def __init__(self, text):
+        self.text = text
+        self.strings = []
+        self.tokens = []
+        self.words = []
+        end = 0
+        for match in self.token.finditer(text):
+            if match.start() != end:
+                break
+            end = match.end()
+            self.strings.append(match.group())
+            self.tokens.append((match.group(1), match.group(2)))
+            self.words.append(self.word.fullmatch(match.group(2)) is not None)
+        self.tags = {pos for pos, _ in self.tokens}
+        self.exact = end == len(text)
+
+# автомат шаблона аспекта над последовательностью токенов
+class TokenAutomaton():
+    """
+    Регулярное выражение шаблона (Template.dct[aspect]) разбирается
+    и компилируется в программу виртуальной машины Пайка над токенами
+    POS<лемма>: переход по токену проверяет множество литералов и частей
+    речи, ветвления (необязательные группы, альтернативы) упорядочены
+    по приоритету так же, как при переборе с возвратом в re. Потоки
+    в одном состоянии сливаются, поэтому время сопоставления линейно
+    по длине предложения, а совпадения и именованные группы такие же,
+    как у re.finditer().
+
+    Части выражения, которые не являются токенами или ссылками
+    на группы (например, ссылка на несуществующий словарь [DictKBD],
+    попадающая в выражение как класс символов), автомат считает
+    несовпадающими; если они могут совпасть в строке предложения,
+    finditer() возвращает None и используется регулярное выражение.
+    """
+    token_run = re.compile(r"(?:\w+<(?:\\w\*|\w*)>)+")
+    token_part = re.compile(r"(\w+)<(\\w\*|\w*)>")
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.names = []
+        self.raw = []
+        tree, end = self.parse(0)
+        if end != len(pattern):
+            raise UnsupportedPattern(f"Unexpected '{pattern[end]}' at {end}")
+        if self.nullable(tree):
+            raise UnsupportedPattern("Pattern matches an empty string")
+        self.tags = {}
+
+        self.program = []
+        self.emit(tree)
+        self.program.append(('match',))
+        # часть выражения, за которой следует токен, совпасть не может: она
+        # заканчивается буквой, и часть речи токена в строке оказалась бы
+        # длиннее части речи шаблона (см. aligned()); проверяются только
+        # части, которыми может заканчиваться совпадение, а если совпадение
+        # не может ими начинаться - только в начале токена
+        starting = {pc for pc, _ in self.closure(0, ('fail',))}
+        guard = []
+        for pc, instruction in enumerate(self.program):
+            if instruction[0] != 'fail':
+                continue
+            raw = self.raw[instruction[1]]
+            if '>' not in raw and \
+                    all(self.program[next_pc][0] == 'token' for next_pc, _ in self.closure(pc + 1)):
+                continue
+            guard.append(raw if '>' in raw or pc in starting else f"(?:^|(?<=>))(?:{raw})")
+        self.guard = re.compile('|'.join(guard)) if guard else None
+        # замыкания после каждого перехода по токену вычисляются заранее
+        self.follow = {pc : self.closure(pc + 1)
+                       for pc, instruction in enumerate(self.program) if instruction[0] == 'token'}
+        self.start = self.closure(0)
+        self.first = self.accepting(self.start)
+
+    # разбор выражения: альтернатива, последовательность, элемент
+    def parse(self, i):
+        branches = []
+        while True:
+            sequence, i = self.parse_sequence(i)
+            branches.append(sequence)
+            if i < len(self.pattern) and self.pattern[i] == '|':
+                i += 1
+                continue
+            return (('alt', branches) if len(branches) > 1 else branches[0]), i
+
+    def parse_sequence(self, i):
+        pattern = self.pattern
+        items = []
+        while i < len(pattern) and pattern[i] not in '|)':
+            if pattern[i] == '(':
+                name = None
+                if pattern.startswith('(?P<', i):
+                    close = pattern.index('>', i)
+                    name = pattern[i + 4:close]
+                    i = close + 1
+                elif pattern.startswith('(?', i):
+                    raise UnsupportedPattern(f"Unsupported group at {i}")
+                else:
+                    i += 1
+                if name is not None:
+                    self.names.append(name)
+                    index = len(self.names) - 1
+                else:
+                    index = None
+                body, i = self.parse(i)
+                if i >= len(pattern) or pattern[i] != ')':
+                    raise UnsupportedPattern("Unbalanced parentheses")
+                i += 1
+                item = ('group', index, body)
+            elif pattern[i] == '[':
+                close = pattern.index(']', i)
+                self.raw.append(pattern[i:close + 1])
+                item = ('raw', len(self.raw) - 1)
+                i = close + 1
+            else:
+                run = self.token_run.match(pattern, i)
+                if run is not None:
+                    i = run.end()
+                    item = ('seq', [('token', frozenset() if lemma == '\\w*' else frozenset([(pos, lemma)]),
+                                     frozenset([pos]) if lemma == '\\w*' else frozenset())
+                                    for pos, lemma in self.token_part.findall(run.group())])
+                else:
+                    start = i
+                    while i < len(pattern) and pattern[i] not in '()|[]?*+{\\':
+                        i += 1
+                    if i == start:
+                        raise UnsupportedPattern(f"Unexpected '{pattern[i]}' at {i}")
+                    self.raw.append(re.escape(pattern[start:i]))
+                    item = ('raw', len(self.raw) - 1)
+                if i < len(pattern) and pattern[i] in '?*+{':
+                    raise UnsupportedPattern(f"Quantified literal at {i}")
+            if i < len(pattern) and pattern[i] in '?*+{':
+                if pattern[i] != '?' or pattern[i + 1:i + 2] in ('?', '+'):
+                    raise UnsupportedPattern(f"Unsupported quantifier at {i}")
+                item = ('opt', item)
+                i += 1
+            items.append(item)
+        return ('seq', items), i
+
+    def nullable(self, node):
+        kind = node[0]
+        if kind in ('token', 'raw'):
+            return False
+        if kind == 'opt':
+            return True
+        if kind == 'group':
+            return self.nullable(node[2])
+        if kind == 'seq':
+            return all(map(self.nullable, node[1]))
+        return any(map(self.nullable, node[1]))
+
+    def single_token(self, node):
+        # необязательная обертка и безымянные группы не меняют переход по одному токену
+        while node[0] == 'group' and node[1] is None or node[0] == 'seq' and len(node[1]) == 1:
+            node = node[2] if node[0] == 'group' else node[1][0]
+        return node if node[0] == 'token' else None
+
+    # компиляция в программу: token, split (приоритет у первой ветви), jmp, save, fail, match
+    def emit(self, node):
+        program = self.program
+        kind = node[0]
+        if kind == 'token':
+            program.append(node)
+        elif kind == 'raw':
+            program.append(('fail', node[1]))
+        elif kind == 'seq':
+            for item in node[1]:
+                self.emit(item)
+        elif kind == 'group':
+            if node[1] is not None:
+                program.append(('save', 2 * node[1]))
+            self.emit(node[2])
+            if node[1] is not None:
+                program.append(('save', 2 * node[1] + 1))
+        elif kind == 'opt':
+            split = len(program)
+            program.append(None)
+            self.emit(node[1])
+            program[split] = ('split', split + 1, len(program))
+        else:
+            # соседние однотокенные варианты объединяются в один переход:
+            # их продолжение одинаково, поэтому порядок между ними не важен
+            branches = []
+            for branch in node[1]:
+                token = self.single_token(branch)
+                if token is not None and branches and branches[-1][0] == 'token':
+                    branches[-1] = ('token', branches[-1][1] | token[1], branches[-1][2] | token[2])
+                else:
+                    branches.append(token or branch)
+            jumps = []
+            for number, branch in enumerate(branches):
+                split = None
+                if number < len(branches) - 1:
+                    split = len(program)
+                    program.append(None)
+                self.emit(branch)
+                if split is not None:
+                    jumps.append(len(program))
+                    program.append(None)
+                    program[split] = ('split', split + 1, len(program))
+            for jump in jumps:
+                program[jump] = ('jmp', len(program))
+
+    def closure(self, pc, kinds = ('token', 'match')):
+        """
+        Замыкание по пустым переходам из pc: список (номер инструкции
+        вида из kinds, номера сохраняемых позиций групп) в порядке
+        приоритета; в каждую инструкцию ведет только первый путь.
+        """
+        result = []
+        seen = set()
+        stack = [(pc, ())]
+        while stack:
+            pc, saves = stack.pop()
+            if pc in seen:
+                continue
+            seen.add(pc)
+            instruction = self.program[pc]
+            kind = instruction[0]
+            if kind in kinds:
+                result.append((pc, saves))
+            elif kind == 'split':
+                stack.append((instruction[2], saves))
+                stack.append((instruction[1], saves))
+            elif kind == 'jmp':
+                stack.append((instruction[1], saves))
+            elif kind == 'save':
+                stack.append((pc + 1, saves + (instruction[1],)))
+        return result
+
+    def aligned(self, tag):
+        """
+        Совпадение регулярного выражения может начаться внутри токена,
+        если часть речи шаблона - собственный суффикс части речи токена;
+        для таких строк автомат не применяется.
+        """
+        if tag not in self.tags:
+            self.tags[tag] = not any(tag != pos and tag.endswith(pos)
+                                     for instruction in self.program if instruction[0] == 'token'
+                                     for pos in instruction[2] | {pos for pos, _ in instruction[1]})
+        return self.tags[tag]
+
+    def accepting(self, closure):
+        consumers = [self.program[pc] for pc, _ in closure if self.program[pc][0] == 'token']
+        return frozenset().union(*(instruction[1] for instruction in consumers)), \
+               frozenset().union(*(instruction[2] for instruction in consumers))
+
+    def search(self, sequence, start, deadline):
+        """
+        Ищет самое левое совпадение, начиная с токена start, с тем же
+        выбором ветвей, что и перебор с возвратом: потоки хранятся
+        в порядке приоритета, поток в состоянии match отсекает
+        менее приоритетные. Возвращает (позиции групп, конец совпадения)
+        или None.
+        """
+        program, follow = self.program, self.follow
+        tokens, words = sequence.tokens, sequence.words
+        literals, wildcards = self.first
+        slots = (None,) * (2 * len(self.names))
+        matched = None
+        threads = []
+        for i in range(start, len(tokens) + 1):
+            if matched is None and i < len(tokens) and \
+                    (tokens[i] in literals or words[i] and tokens[i][0] in wildcards):
+                seen = {pc for pc, _ in threads}
+                for pc, saves in self.start:
+                    if pc not in seen:
+                        seen.add(pc)
+                        threads.append((pc, self.save(slots, saves, i)))
+            if not threads:
+                if matched is not None:
+                    break
+                continue
+            if deadline is not None and i % 16 == 0 and time.perf_counter() > deadline:
+                raise TimeBudgetExceeded()
+            following = []
+            seen = set()
+            for pc, captured in threads:
+                instruction = program[pc]
+                if instruction[0] == 'match':
+                    matched = captured, i
+                    break
+                if i < len(tokens) and (tokens[i] in instruction[1] or
+                                        words[i] and tokens[i][0] in instruction[2]):
+                    for next_pc, saves in follow[pc]:
+                        if next_pc not in seen:
+                            seen.add(next_pc)
+                            following.append((next_pc, self.save(captured, saves, i + 1)))
+            threads = following
+        return matched
+
+    @staticmethod
+    def save(captured, saves, position):
+        if not saves:
+            return captured
+        captured = list(captured)
+        for slot in saves:
+            captured[slot] = position
+        return tuple(captured)
+
+    def finditer(self, sentence, sequence = None, deadline = None):
+        """
+        Возвращает список словарей именованных групп (как groupdict()
+        у совпадений re.finditer()) или None, если строку нельзя
+        сопоставить автоматом и нужно регулярное выражение.
+        При исчерпании времени (deadline по time.perf_counter())
+        исключение TimeBudgetExceeded содержит уже найденные совпадения.
+        """
+        sequence = sequence or TokenSequence(sentence)
+        if not self.applicable(sentence, sequence):
+            return None
+        result = []
+        start = 0
+        while start < len(sequence.tokens):
+            try:
+                found = self.search(sequence, start, deadline)
+            except TimeBudgetExceeded:
+                raise TimeBudgetExceeded(result)
+            if found is None:
+                break
+            captured, start = found
+            result.append({name : ''.join(sequence.strings[captured[2*index]:captured[2*index + 1]])
+                                  if captured[2*index] is not None else None
+                           for index, name in enumerate(self.names)})
+        return result
+
+    def exists(self, sentence, sequence = None, deadline = None):
+        """
+        Есть ли в строке хотя бы одно совпадение: поиск останавливается
+        на первом, группы не извлекаются. None - как у finditer().
+        """
+        sequence = sequence or TokenSequence(sentence)
+        if not self.applicable(sentence, sequence):
+            return None
+        if not sequence.tokens:
+            return False
+        try:
+            return self.search(sequence, 0, deadline) is not None
+        except TimeBudgetExceeded:
+            raise TimeBudgetExceeded(False)
+
+    def applicable(self, sentence, sequence):
+        if not sequence.exact or self.guard is not None and self.guard.search(sentence):
+            return False
+        return all(map(self.aligned, sequence.tags))
 
 class Template():
+    pw = re.compile(r'\w+')  # для литерала без части речи
+
     def __init__(self, text, aspect):
         self.dct = {}
         self.dct_len = {}
+        self.literals = {}
         self.aspect = aspect
         self.pt = re.compile("\w*<\w*>")  # для слов
         self.pr = re.compile('\[(\w*)\]') # для группы слов
@@ -93,7 +637,103 @@ class Template():
                     self.dct[name] = f"(?P<{name}>{result})" # result = группы слов: (...)?... / шаблон: (?P<Pattern№>(...)?...)
                     if result[0:2] != '(?':
                         self.dct_len[name] = result.count('?') + 1
+                
+                self.literals[name] = self.alternatives_literals([
+                    [part.strip() for part in alternative.split() if part]
+                    for alternative in right.split('|')
+                ])
         self.regexp = re.compile(self.dct[self.aspect])
+        self.required = self.literals.get(self.aspect)
+        self.automaton = self.build_automaton()
+    
+    @classmethod
+    def from_compiled(cls, aspect, dct, dct_len, literals):
+        """
+        Восстанавливает шаблон из уже раскрытых определений
+        (см. compiled()), не разбирая файл шаблонов заново.
+        """
+        template = cls.__new__(cls)
+        template.dct = dct
+        template.dct_len = dct_len
+        template.literals = literals
+        template.aspect = aspect
+        template.pt = re.compile(r"\w*<\w*>")
+        template.pr = re.compile(r'\[(\w*)\]')
+        template.regexp = re.compile(dct[aspect])
+        template.required = literals.get(aspect)
+        template.automaton = template.build_automaton()
+        return template
+    
+    def build_automaton(self):
+        """
+        Автомат над токенами (см. TokenAutomaton) или None, если выражение
+        шаблона содержит конструкции, которые он не поддерживает;
+        тогда используется только регулярное выражение.
+        """
+        try:
+            return TokenAutomaton(self.dct[self.aspect])
+        except UnsupportedPattern:
+            return None
+    
+    def match_groups(self, sentence, deadline = None):
+        """
+        Именованные группы совпадений регулярного выражения. С ограничением
+        времени выражение выполняется модулем regex, который умеет
+        прерывать перебор по таймауту.
+        """
+        if deadline is None:
+            return [res.groupdict() for res in self.regexp.finditer(sentence)]
+        result = []
+        try:
+            for res in self.timed().finditer(sentence, timeout=max(deadline - time.perf_counter(), 0)):
+                result.append(res.groupdict())
+        except TimeoutError:
+            raise TimeBudgetExceeded(result)
+        return result
+    
+    def match_exists(self, sentence, deadline = None):
+        if deadline is None:
+            return self.regexp.search(sentence) is not None
+        try:
+            return self.timed().search(sentence, timeout=max(deadline - time.perf_counter(), 0)) is not None
+        except TimeoutError:
+            raise TimeBudgetExceeded(False)
+    
+    def timed(self):
+        if getattr(self, 'timed_regexp', None) is None:
+            self.timed_regexp = regex.compile(self.dct[self.aspect])
+        return self.timed_regexp
+    
+    def compiled(self):
+        return self.dct, self.dct_len, self.literals
+    
+    def part_literals(self, text):
+        """
+        Возвращает множество литералов Pos<слово>, хотя бы один из которых
+        входит в любое совпадение части шаблона, или None, если такого
+        множества нет (необязательная группа, группа частей речи и т.п.).
+        """
+        if re.match(self.pr, text) is not None:
+            return None
+        if self.dct.get(text, None):
+            return self.literals.get(text)
+        if self.pt.fullmatch(text) or self.pw.fullmatch(text):
+            return frozenset([text])
+        return None
+    
+    def alternatives_literals(self, alternatives):
+        """
+        Для последовательности частей достаточно одной обязательной части
+        (берется та, у которой меньше литералов), для альтернативы нужны
+        литералы каждого варианта.
+        """
+        result = []
+        for parts in alternatives:
+            required = [literals for literals in map(self.part_literals, parts) if literals]
+            if not required:
+                return None
+            result.append(min(required, key=len))
+        return frozenset().union(*result)
     
     def key(self, text):
         key = re.match(self.pr, text)
@@ -113,11 +753,66 @@ class Template():
         else:
             return text
     
-    def analyze(self, sentence):
+    def analyze(self, sentence, sequence = None, deadline = None):
+        """
+        Совпадения ищутся автоматом над токенами за линейное время;
+        регулярное выражение используется, только если автомат
+        не применим к шаблону или строке. При исчерпании времени
+        (deadline) исключение TimeBudgetExceeded содержит результат
+        по уже найденным совпадениям.
+        """
+        try:
+            groups = self.find_groups(sentence, sequence, deadline)
+        except TimeBudgetExceeded as error:
+            raise TimeBudgetExceeded(self.analyze_groups(error.args[0]))
+        return self.analyze_groups(groups)
+
+    def find_groups(self, sentence, sequence = None, deadline = None):
+        groups = None
+        if self.automaton is not None:
+            groups = self.automaton.finditer(sentence, sequence, deadline)
+        if groups is None:
+            groups = self.match_groups(sentence, deadline)
+        return groups
+
+    def best(self, sentence, sequence = None, deadline = None):
+        """
+        Только лучшее совпадение - первый элемент результата analyze():
+        список из одного словаря или пустой. Словари строятся не для всех
+        совпадений, и список не сортируется.
+        """
+        try:
+            groups = self.find_groups(sentence, sequence, deadline)
+        except TimeBudgetExceeded as error:
+            raise TimeBudgetExceeded(self.best_groups(error.args[0]))
+        return self.best_groups(groups)
+
+    def best_groups(self, groups):
+        # при равном количестве слов остается первое совпадение, как при устойчивой сортировке
+        best, best_score = None, None
+        for groupdict in groups:
+            score = max([len(self.pt.findall(s)) for s in groupdict.values() if s is not None])
+            if best_score is None or score > best_score:
+                best, best_score = groupdict, score
+        return self.analyze_groups([best]) if best is not None else []
+
+    def present(self, sentence, sequence = None, deadline = None):
+        """
+        Есть ли хотя бы одно совпадение (True/False): поиск останавливается
+        на первом совпадении, словари групп не строятся.
+        """
+        found = None
+        if self.automaton is not None:
+            found = self.automaton.exists(sentence, sequence, deadline)
+        if found is None:
+            found = self.match_exists(sentence, deadline)
+        return found
+
+    def analyze_groups(self, groups):
         dct_list = [
             {name : (s, len(list(self.pt.finditer(s))), self.dct_len[name] if name != self.aspect else 1)
-             for name, s in res.groupdict().items() if s is not None}
-            for res in self.regexp.finditer(sentence)
+             for name, s in groupdict.items() if s is not None}
+            for groupdict in groups
         ]
         # name = название шаблона; s = строка; № = количество слов
 
@@ -126,12 +821,16 @@ class Template():
         return dct_list
 
 
+# общий для процесса реестр шаблонов
+template_registry = TemplateRegistry()
+
+
 if __name__ == '__main__':    
     file = open('text.txt', 'r')
     text = file.read()
     
     processor = TextProcessor(flag = True)
-    for i, (_, new) in enumerate(processor.parse(sent_tokenize(text, language='russian'))):
+    for i, (_, new) in enumerate(processor.parse(resources.sent_tokenize(text, language='russian'))):
         search_result = processor.apply(new)
         print(f"Sentence: {i+1}")
         print(new)
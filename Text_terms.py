@@ -1,23 +1,161 @@
 # -*- coding: utf-8 -*-
 
-from nltk.stem.snowball import RussianStemmer
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize, sent_tokenize
-import pymorphy2
+from Morph_cache import morph_cache
+from Resources import resources
 
-from collections import Counter
+from array import array
+from collections import Counter, namedtuple
 import itertools
 import regex as re
 
 # нормализация термина
 def normalize(term):
-    return normalize.stemmer.stem(normalize.lemmatizer_ru.parse(term)[0].normal_form)
-normalize.lemmatizer_ru = pymorphy2.MorphAnalyzer()
-normalize.stemmer = RussianStemmer()
+    return normalize.cache.lookup(term).stem
+normalize.cache = morph_cache
+
+# запись о токене: словоформа, стема, лемма и часть речи LSPL, признак стоп-слова (не термина)
+Token = namedtuple('Token', ['word', 'stem', 'lemma', 'pos', 'stop'])
+
+# токенизация и морфологический анализ предложения за один проход
+def analyze_sentence(sentence, check=None):
+    """
+    Предложение токенизируется один раз, каждая словоформа разбирается
+    через общий морфологический кэш. Полученные записи используются
+    и при подсчете весов по стемам, и при поиске аспектов по шаблонам.
+    Функция check определяет, является ли словоформа термином.
+    """
+    return analyze_words(resources.word_tokenize(sentence), check)
+
+# морфологический анализ уже выделенных словоформ
+def analyze_words(words, check=None):
+    tokens = []
+    for word in words:
+        record = morph_cache.lookup(word)
+        tokens.append(Token(word, record.stem, record.lemma, record.pos,
+                            not check(word) if check else False))
+    return tokens
 
 # возвращает список стем в виде [[[],[],[]],[[],[]]], где второй уровень - абзацы, третий - предложения
 def text_segmentor(text):
-    return [sent_tokenize(paragraph) for paragraph in re.split(r"[\r\n]+", text)]
+    return [resources.sent_tokenize(paragraph) for paragraph in re.split(r"[\r\n]+", text)]
+
+# ленивое разбиение на абзацы и предложения
+def iter_segments(lines):
+    """
+    Построчный аналог text_segmentor(): каждая непустая строка - абзац,
+    разбитый на предложения. Принимает любой итератор строк (например,
+    открытый файл), поэтому весь текст в память не загружается.
+    """
+    for line in lines:
+        paragraph = line.strip('\r\n')
+        if paragraph:
+            yield resources.sent_tokenize(paragraph)
+
+# токенизатор русского текста за один проход регулярного выражения
+class RussianTokenizer():
+    """
+    Замена связки sent_tokenize() + word_tokenize() + SUMMARIZER.check()
+    для русского текста. Абзац просматривается одним регулярным
+    выражением: по ходу выделяются предложения и словоформы,
+    которые могут быть терминами (слова, в том числе через дефис,
+    числа, сокращения) и знаки ! и ?; прочая пунктуация отбрасывается.
+    Стоп-слова отсекаются проверкой по frozenset.
+
+    Границы предложений повторяют поведение Punkt (модель по умолчанию,
+    sent_tokenize()) для русского текста: предложение заканчивается на .,
+    ! или ? (вместе с закрывающими кавычками и скобками), за которыми
+    следует пробел, кроме многоточия, однобуквенных сокращений и инициалов
+    ("г. В Москве", "А. С. Пушкин", "т. е.") и числа с точкой перед словом
+    со строчной буквы ("в 5. потом"). Многобуквенные сокращения ("ул.",
+    "проф.") разделяют предложения, как и в Punkt.
+    Точка внутри предложения остается частью слова, как в word_tokenize().
+
+    Известные отличия от NLTK:
+    - английские сокращения из модели Punkt ("Mr.", "e.g.") разделяют предложения;
+    - после многоточия, отделенного пробелами (" ... «Да.»"), Punkt иногда
+      разделяет предложения, а здесь граница после многоточия не ставится;
+    - словоформы со знаками, не входящими в слово, разбираются иначе:
+      word_tokenize() оставляет "+25°C" и "-3°C" одной словоформой, которую
+      SUMMARIZER.check() отбрасывает, а "40€" - термином "40€", здесь же
+      получаются термины "25", "C", "3" и "40".
+    """
+    token = re.compile(r"(?P<word>\w+(?:[-.,:/'’]\w+)*)(?P<dot>\.(?!\.))?"
+                       r"|(?P<mark>[!?])|(?P<ellipsis>\.\.+|…)|(?P<end>\.)"
+                       r"|(?P<close>[\"»”')\]}])|[^\w\s]")
+    number = re.compile(r"\d[\d,.\-]*")
+    # символы, перед которыми Punkt начинает новую словоформу
+    word_start = frozenset('()"`{}[]:;&#*@-,')
+
+    @property
+    def stopwords(self):
+        return resources.stopwords
+
+    def check(self, word):
+        return word not in self.stopwords
+
+    def segment(self, text):
+        """
+        Аналог text_segmentor(): абзацы из списков пар
+        (предложение, [словоформа, ...]).
+        """
+        return [self.split(paragraph) for paragraph in re.split(r"[\r\n]+", text)]
+
+    def split(self, paragraph):
+        sentences = []
+        words = []
+        start = None
+        # конец возможной границы предложения и что стоит перед точкой:
+        # 'initial' - отдельная буква (граница только перед не буквой),
+        # 'number' - число (граница только перед не строчной буквой), None - прочее
+        end = None
+        before = None
+        for match in self.token.finditer(paragraph):
+            kind = 'word' if match.group('word') else match.lastgroup
+            if end is not None:
+                if kind == 'close' and match.start() == end:
+                    end = match.end()
+                    continue
+                following = paragraph[match.start()]
+                if match.start() > end and not (before == 'initial' and following.isalpha()) \
+                        and not (before == 'number' and following.islower()):
+                    sentences.append((paragraph[start:end], self.final(words)))
+                    start = None
+                    words = []
+                end = None
+            if start is None:
+                start = match.start()
+            if kind == 'word':
+                word = match.group()
+                words.append(word)
+                if match.group('dot'):
+                    end = match.end()
+                    before = self.abbreviation(paragraph, match.start(), match.group('word'))
+            elif kind == 'mark':
+                words.append(match.group())
+                end = match.end()
+                before = None
+            elif kind == 'end':
+                end = match.end()
+                before = None
+        if start is not None:
+            sentences.append((paragraph[start:].rstrip(), self.final(words)))
+        return sentences
+
+    def abbreviation(self, paragraph, start, word):
+        # как в Punkt, инициал - отдельная словоформа из одной буквы
+        # (Punkt отделяет от слова открывающие скобки, дефис, запятую и т.п.)
+        if len(word) == 1 and word.isalpha() and (start == 0 or paragraph[start-1].isspace()
+                                                    or paragraph[start-1] in self.word_start):
+            return 'initial'
+        if self.number.fullmatch(word):
+            return 'number'
+        return None
+
+    def final(self, words):
+        # точка в конце предложения отделяется от последнего слова, как в word_tokenize()
+        if words and len(words[-1]) > 1 and words[-1][-1] == '.' and words[-1][-2] != '.':
+            words[-1] = words[-1][:-1]
+        return words
 
 # поиск имен собственных
 def lookForProper(structured_stems):
@@ -47,7 +185,14 @@ def simpleTermFreqCount(big_lst):
     Стемы с частотностью выше среднего арифм. выбираются в список termsfreq.
     Список termsfreq - это кортежи с парами (слово, относительная частота)
     """
-    stemfreqs = Counter(big_lst)
+    return countTermFreqs(Counter(big_lst))
+
+# относительные частоты стем по готовому словарю частот
+def countTermFreqs(stemfreqs):
+    """
+    То же, что simpleTermFreqCount(), но по уже подсчитанному
+    словарю частот стем (например, накопленному при потоковой обработке).
+    """
     total_stems_in_text = sum(stemfreqs.values())
     mean_freq = total_stems_in_text / len(stemfreqs.values())
     termsfreq = [
@@ -62,7 +207,7 @@ def simpleTermFreqCount(big_lst):
 class StructuredText():
     def __init__(self, text):
         self.text = text
-        self.len = len(list(itertools.chain.from_iterable(self.text)))
+        self.len = sum(map(len, self.text))
     
     def sentences(self):
         return list(itertools.chain.from_iterable(self.text))
@@ -74,4 +219,166 @@ class StructuredText():
                 for sentence in paragraph
             ]
             for paragraph in self.text
-        ]
\ No newline at end of file
+        ]
+
+
+# предложение компактного текста
+class SentenceView():
+    """
+    Представление предложения CompactText без копирования данных:
+    хранит только ссылку на текст и границы в общем массиве токенов.
+    Ведет себя как список пар (стема, слово), поддерживает срезы.
+    """
+    __slots__ = ('source', 'start', 'end')
+
+    def __init__(self, source, start, end):
+        self.source = source
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, end, step = key.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, end, step)]
+            return SentenceView(self.source, self.start + start, self.start + max(start, end))
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('sentence index out of range')
+        return self.source.pair(self.start + key)
+
+    def __iter__(self):
+        vocabulary = self.source.vocabulary
+        for stem_id, word_id in zip(self.stem_ids(), self.word_ids()):
+            yield vocabulary[stem_id], vocabulary[word_id]
+
+    def stem_ids(self):
+        return memoryview(self.source.stem_ids)[self.start:self.end]
+
+    def word_ids(self):
+        return memoryview(self.source.word_ids)[self.start:self.end]
+
+# абзац компактного текста
+class ParagraphView():
+    """
+    Представление абзаца CompactText без копирования данных:
+    последовательность SentenceView.
+    """
+    __slots__ = ('source', 'start', 'end')
+
+    def __init__(self, source, start, end):
+        self.source = source
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('paragraph index out of range')
+        return self.source.sentence(self.start + key)
+
+    def __iter__(self):
+        for index in range(self.start, self.end):
+            yield self.source.sentence(index)
+
+# компактный текст
+class CompactText():
+    """
+    Компактное представление текста из пар (стема, слово):
+    стемы и слова заменяются номерами в общей таблице словаря,
+    номера хранятся в плоских массивах array, границы предложений
+    и абзацев - в массивах смещений. Предложения и абзацы выдаются
+    как представления (SentenceView, ParagraphView) без копирования,
+    поэтому CompactText можно передавать вместо StructuredText
+    в lookForProper(), countFinalWeights() и другие функции подсчета весов.
+    """
+    __slots__ = ('vocabulary', 'ids', 'stem_ids', 'word_ids',
+                 'sentence_offsets', 'paragraph_offsets')
+
+    def __init__(self):
+        self.vocabulary = []
+        self.ids = {}
+        self.stem_ids = array('i')
+        self.word_ids = array('i')
+        self.sentence_offsets = array('l', [0])
+        self.paragraph_offsets = array('l', [0])
+
+    @classmethod
+    def from_paragraphs(cls, paragraphs):
+        """
+        Строит компактный текст из вложенной структуры
+        [[предложение из пар (стема, слово), ...], ...] (как StructuredText.text).
+        """
+        compact = cls()
+        for paragraph in paragraphs:
+            for sentence in paragraph:
+                compact.add_sentence(sentence)
+            compact.end_paragraph()
+        return compact
+
+    def intern(self, string):
+        index = self.ids.get(string)
+        if index is None:
+            index = self.ids[string] = len(self.vocabulary)
+            self.vocabulary.append(string)
+        return index
+
+    def add_sentence(self, pairs):
+        for stem, word in pairs:
+            self.stem_ids.append(self.intern(stem))
+            self.word_ids.append(self.intern(word))
+        self.sentence_offsets.append(len(self.stem_ids))
+
+    def end_paragraph(self):
+        self.paragraph_offsets.append(len(self.sentence_offsets) - 1)
+
+    def pair(self, position):
+        return self.vocabulary[self.stem_ids[position]], self.vocabulary[self.word_ids[position]]
+
+    def sentence(self, index):
+        return SentenceView(self, self.sentence_offsets[index], self.sentence_offsets[index+1])
+
+    def paragraph(self, index):
+        return ParagraphView(self, self.paragraph_offsets[index], self.paragraph_offsets[index+1])
+
+    @property
+    def len(self):
+        return len(self.sentence_offsets) - 1
+
+    @property
+    def text(self):
+        return [self.paragraph(index) for index in range(len(self.paragraph_offsets) - 1)]
+
+    def sentences(self):
+        return [self.sentence(index) for index in range(self.len)]
+
+    def term_freqs(self):
+        """
+        Частоты стем каждого предложения для методов подсчета весов:
+        список словарей {стема: частота} (ключи в порядке первого вхождения,
+        как у Counter по стемам предложения). Считаются один раз по массиву
+        номеров стем; строки стем берутся из таблицы словаря и не копируются.
+        """
+        vocabulary = self.vocabulary
+        stem_ids = memoryview(self.stem_ids)
+        offsets = self.sentence_offsets
+        return [{vocabulary[stem_id] : count
+                 for stem_id, count in Counter(stem_ids[offsets[index]:offsets[index+1]]).items()}
+                for index in range(self.len)]
+
+    def stems(self):
+        vocabulary = self.vocabulary
+        return (vocabulary[stem_id] for stem_id in self.stem_ids)
+
+    def map_sent(self, func):
+        return [[func(sentence) for sentence in paragraph] for paragraph in self.text]
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from scipy import sparse
+import regex as re
+
+from Text_terms import CompactText
+
+# векторный подсчет весов предложений
+class VectorizedSummarizationWeightCount():
+    """
+    Альтернативная реализация подсчета весов терминов и предложений
+    (simpleTermFreqCount(), countFinalWeights() и
+    SymmetricalSummarizationWeightCount.countFinalSymmetryWeight())
+    на разреженной матрице "предложение x термин" с целочисленными
+    номерами терминов. Все шаги выполняются операциями над массивами,
+    результат совпадает с исходной реализацией с точностью до
+    погрешности вычислений с плавающей точкой.
+    """
+
+    def __init__(self):
+        self.f_digits = re.compile(r"[0-9]+([\.\,\:][0-9]+)*")
+
+    def buildMatrix(self, sentences):
+        """
+        Метод присваивает стемам целочисленные номера и строит
+        разреженную матрицу частот стем в предложениях (CSR).
+        Принимает список предложений из пар (стема, слово).
+        Возвращается пара (матрица, список стем по номерам).
+        """
+        vocabulary = {}
+        rows = []
+        cols = []
+        for row, sentence in enumerate(sentences):
+            for stem, word in sentence:
+                rows.append(row)
+                cols.append(vocabulary.setdefault(stem, len(vocabulary)))
+        counts = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int64), (rows, cols)),
+            shape=(len(sentences), len(vocabulary)))
+        counts.sum_duplicates()
+        return counts, list(vocabulary)
+
+    def buildCompactMatrix(self, compact_text):
+        """
+        То же, что buildMatrix(), для текста CompactText: номера стем
+        берутся прямо из его массивов без обхода пар (стема, слово).
+        """
+        stem_ids = np.frombuffer(compact_text.stem_ids, dtype=compact_text.stem_ids.typecode)
+        offsets = np.frombuffer(compact_text.sentence_offsets, dtype=compact_text.sentence_offsets.typecode)
+        used_ids, cols = np.unique(stem_ids, return_inverse=True)
+        rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        counts = sparse.csr_matrix(
+            (np.ones(len(cols), dtype=np.int64), (rows, cols)),
+            shape=(len(offsets) - 1, len(used_ids)))
+        counts.sum_duplicates()
+        return counts, [compact_text.vocabulary[stem_id] for stem_id in used_ids]
+
+    def countTermWeights(self, counts, stems, paragraph_bounds, q_excl_rows, total_sents_in_text, pnn_mask,
+                         idf_weights = None):
+        """
+        Векторный аналог simpleTermFreqCount() и countFinalWeights().
+        paragraph_bounds - список пар (первое предложение, число предложений)
+        для непустых абзацев, q_excl_rows - номера вопросительных
+        и восклицательных предложений, idf_weights - массив idf терминов
+        (если задан индекс по корпусу). Возвращается массив весов терминов,
+        в котором у терминов, не прошедших отбор по среднему весу, стоит 0.
+        """
+        freqs = np.asarray(counts.sum(axis=0)).ravel()
+        total_stems_in_text = freqs.sum()
+        in_dict = freqs >= total_stems_in_text / len(freqs)
+        weighted = np.where(in_dict, freqs / total_stems_in_text, 0.0)
+        if idf_weights is not None:
+            weighted = weighted * idf_weights
+
+        # стемы первых и последних предложений абзацев
+        first_last_rows = sorted({row
+            for start, size in paragraph_bounds
+            for row in ((start, start + size - 1) if size > 1 else (start,))})
+        first_last_mask = np.asarray(counts[first_last_rows].sum(axis=0)).ravel() > 0
+        total_stems_in_first_last = np.count_nonzero(first_last_mask)
+        total_dictwords_in_first_last = np.count_nonzero(first_last_mask & in_dict)
+        avg_dictwords_in_first_last = total_dictwords_in_first_last / total_stems_in_first_last
+        avg_stems_in_first_last = total_stems_in_first_last / total_stems_in_text
+        first_last_factor = avg_dictwords_in_first_last / avg_stems_in_first_last
+
+        # стемы вопросительных и восклицательных предложений
+        q_excl_mask = np.asarray(counts[q_excl_rows].sum(axis=0)).ravel() > 0
+        q_excl_mask &= np.array([stem not in '?!' for stem in stems])
+        q_excl_factor = len(q_excl_rows) / total_sents_in_text
+
+        weighted = np.where(first_last_mask & in_dict, weighted * first_last_factor, weighted)
+        weighted = np.where(q_excl_mask & in_dict, weighted * q_excl_factor, weighted)
+        weighted = np.where(pnn_mask & in_dict, weighted * first_last_factor, weighted)
+
+        mean_weight = weighted[in_dict].mean()
+        return np.where(in_dict & (weighted > mean_weight), weighted, 0.0)
+
+    def countLinks(self, counts):
+        """
+        Векторный аналог SymmetricalSummarizationWeightCount.countLinks():
+        сумма max(c, c') по всем парам предложений с общим термином.
+        max(c, c') раскладывается по порогам t = 1..max частоты:
+        если c >= t, порог дает вклад от всех остальных предложений
+        с термином, иначе - от предложений, где частота термина не меньше t.
+        Возвращается массив суммарных весов связей (влево и вправо).
+        """
+        present = (counts > 0).astype(np.int64)
+        others = np.asarray(present.sum(axis=0)).ravel() - 1
+        links = np.zeros(counts.shape[0], dtype=np.int64)
+        for threshold in range(1, counts.max() + 1 if counts.nnz else 1):
+            above = (counts >= threshold).astype(np.int64)
+            above_df = np.asarray(above.sum(axis=0)).ravel()
+            links += above @ others + (present - above) @ above_df
+        return links
+
+    def countSentenceWeights(self, stemmed_text, stemmed_pnn, total_sents_in_text, idf = None):
+        """
+        Метод считает итоговые веса предложений так же, как цепочка
+        simpleTermFreqCount(), countFinalWeights() и countFinalSymmetryWeight().
+        Принимает текст из пар (стема, слово), сгруппированных по абзацам
+        (StructuredText или CompactText),
+        множество стем "имен собственных", общее количество предложений
+        и, если нужно, индекс idf (Idf_index.IdfIndex).
+        Возвращается список кортежей (номера терминов предложения, вес),
+        пригодный для convertFinalWeights().
+        """
+        sentences = stemmed_text.sentences()
+        if isinstance(stemmed_text, CompactText):
+            counts, stems = self.buildCompactMatrix(stemmed_text)
+        else:
+            counts, stems = self.buildMatrix(sentences)
+        q_excl_rows = [row for row, sentence in enumerate(sentences)
+                       if sentence and sentence[-1][0] in {'?', '!'}]
+
+        paragraph_bounds = []
+        start = 0
+        for paragraph in stemmed_text.text:
+            if paragraph:
+                paragraph_bounds.append((start, len(paragraph)))
+            start += len(paragraph)
+
+        pnn_mask = np.array([stem in stemmed_pnn for stem in stems])
+        digit_mask = np.array([bool(re.fullmatch(self.f_digits, stem)) for stem in stems], dtype=np.int64)
+        idf_weights = np.array([idf.get(stem) for stem in stems]) if idf is not None else None
+        tfidf = self.countTermWeights(counts, stems, paragraph_bounds, q_excl_rows,
+                                      total_sents_in_text, pnn_mask, idf_weights)
+
+        own_weights = counts @ tfidf
+        pscore = 10 / np.arange(1, counts.shape[0] + 1)
+        weights = 2 * own_weights + self.countLinks(counts) + 2 * pscore
+
+        present = counts > 0
+        proper = present @ pnn_mask.astype(np.int64)
+        weights = weights * np.where(proper > 0, 1 + np.log2(np.maximum(proper, 1)), 1)
+        digits = counts @ digit_mask
+        weights = weights * np.where(digits > 0, 1 + np.log2(np.maximum(digits, 1)), 1)
+
+        # average sentence length
+        asl = counts.sum() / total_sents_in_text
+        lengths = np.diff(counts.indptr)
+        weights = np.where(lengths > 5, asl * weights / np.maximum(lengths, 1), weights)
+
+        return [(counts.indices[counts.indptr[row]:counts.indptr[row+1]], float(weight))
+                for row, weight in enumerate(weights)]